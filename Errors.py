@@ -23,3 +23,8 @@ class DataError(Error):
     pass
 
 
+class BudgetError(Error):
+    """Raised when plot data would exceed the memory limit"""
+    pass
+
+
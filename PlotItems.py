@@ -13,13 +13,19 @@ your own classes from the PlotItem hierarchy to customize their
 behavior.
 
 """
-import os, string, tempfile, types
+import os, shutil, string, itertools, weakref
 
 from io import StringIO
 
 import numpy
 
-import gp, utils, Errors
+import gp, utils, budget, tempfiles, Errors
+
+try:
+    from shlex import quote as _shell_quote
+except ImportError:
+    # for backwards compatibility to pre-3.3:
+    from pipes import quote as _shell_quote
 
 
 class _unset:
@@ -28,7 +34,69 @@ class _unset:
     pass
 
 
-class PlotItem:
+# Cache of formatted option strings (see 'set_string_option'):
+_option_strings = {}
+
+
+class _OptionsView(object):
+    """A dictionary-like view of the options stored in a PlotItem.
+
+    See the description of '_options' in the 'PlotItem' docstring.
+
+    """
+
+    __slots__ = ('_item',)
+
+    def __init__(self, item):
+        self._item = item
+
+    def __getitem__(self, name):
+        item = self._item
+        i = 2 * item._option_slot(name)
+        values = item._values
+        if values is None or i >= len(values) or values[i] is _unset:
+            raise KeyError(name)
+        return (values[i], values[i + 1])
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __setitem__(self, name, value):
+        (val, str) = value
+        self._item._set_option_value(name, val, str)
+
+    def __delitem__(self, name):
+        self[name]
+        self._item._set_option_value(name, _unset, None)
+
+    def keys(self):
+        item = self._item
+        names = [None] * len(item._option_table)
+        for (name, i) in item._option_table.items():
+            names[i] = name
+        values = item._values or []
+        return [
+            names[i // 2] for i in range(0, len(values), 2)
+            if values[i] is not _unset
+            ]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(name, self[name]) for name in self.keys()]
+
+
+class PlotItem(object):
     """Plotitem represents an item that can be plotted by gnuplot.
 
     For the finest control over the output, you can create 'PlotItems'
@@ -73,6 +141,19 @@ class PlotItem:
               {'title' : ('Data', 'title "Data"'),
                'with' : ('linespoints', 'with linespoints')}
 
+          To keep items small, the options are not actually stored in
+          a dictionary: '_options' is a view of the list '_values',
+          which holds <option> and <string> for each option at the
+          position given by the class's '_option_table' (built from
+          '_option_sequence' when first needed).  The list is only
+          allocated when the first option is set.
+
+      '_command' -- the string most recently returned by 'command()',
+          or None.  It is discarded whenever an option is set or
+          cleared.  Derived classes whose base command string can
+          change without an option changing should set the class
+          variable '_cache_command' to false.
+
     """
 
     # For _option_list explanation, see docstring for PlotItem.
@@ -95,6 +176,57 @@ class PlotItem:
         'axes', 'title', 'with', 'fs'
         ]
 
+    # whether the string built by command() may be reused:
+    _cache_command = 1
+
+    # Instances have no __dict__ (derived classes that don't define
+    # __slots__ get one automatically):
+    __slots__ = ('_values', '_command', '__weakref__')
+
+    def _option_slot(self, name):
+        """Return the position of option 'name' in '_values' (halved).
+
+        The table of positions is built once per class, the first
+        time it is needed.  Options not in '_option_sequence' are
+        added to the end of it.
+
+        """
+
+        cls = self.__class__
+        table = cls.__dict__.get('_option_table')
+        if table is None:
+            table = {}
+            for option in cls._option_sequence:
+                table[option] = len(table)
+            cls._option_table = table
+        try:
+            return table[name]
+        except KeyError:
+            table[name] = len(table)
+            return table[name]
+
+    def _set_option_value(self, name, value, str):
+        i = 2 * self._option_slot(name)
+        values = self._values
+        if values is None:
+            if value is _unset:
+                return
+            values = self._values = [_unset, None] * len(self._option_table)
+        elif i >= len(values):
+            values.extend([_unset, None] * ((i - len(values)) // 2 + 1))
+        values[i] = value
+        values[i + 1] = str
+
+    def _get_options(self):
+        return _OptionsView(self)
+
+    def _set_options(self, options):
+        self._values = None
+        for (name, (value, str)) in options.items():
+            self._set_option_value(name, value, str)
+
+    _options = property(_get_options, _set_options)
+
     def __init__(self, **keyw):
         """Construct a 'PlotItem'.
 
@@ -114,7 +246,8 @@ class PlotItem:
 
         """
 
-        self._options = {}
+        self._values = None
+        self._command = None
         self.set_option(**keyw)
 
     def get_option(self, name):
@@ -122,7 +255,7 @@ class PlotItem:
 
         try:
             return self._options[name][0]
-        except:
+        except KeyError:
             raise KeyError('option %s is not set!' % name)
 
     def set_option(self, **keyw):
@@ -137,6 +270,7 @@ class PlotItem:
 
         """
 
+        self._command = None
         for (option, value) in keyw.items():
             try:
                 setter = self._option_list[option]
@@ -152,29 +286,38 @@ class PlotItem:
         """Set an option that takes a string value."""
 
         if value is None:
-            self._options[option] = (value, default)
+            self._set_option_value(option, value, default)
         elif isinstance(value, str):
-            self._options[option] = (value, fmt % value)
+            # Share the strings of options that many items have in
+            # common (e.g., 'with lines'):
+            try:
+                text = _option_strings[fmt, value]
+            except KeyError:
+                text = fmt % value
+                if len(_option_strings) < 4096:
+                    _option_strings[fmt, value] = text
+            self._set_option_value(option, value, text)
         else:
             Errors.OptionError('%s=%s' % (option, value,))
 
     def clear_option(self, name):
         """Clear (unset) a plot option.  No error if option was not set."""
 
-        try:
-            del self._options[name]
-        except KeyError:
-            pass
+        self._command = None
+        self._set_option_value(name, _unset, None)
 
     def get_base_command_string(self):
         raise NotImplementedError()
 
     def get_command_option_string(self):
+        values = self._values
+        if values is None:
+            return ''
         cmd = []
         for opt in self._option_sequence:
-            (val,str) = self._options.get(opt, (None,None))
-            if str is not None:
-                cmd.append(str)
+            i = 2 * self._option_slot(opt)
+            if i < len(values) and values[i + 1] is not None:
+                cmd.append(values[i + 1])
         return ' '.join(cmd)
 
     def command(self):
@@ -182,14 +325,32 @@ class PlotItem:
 
         Build and return the plot command, with options, necessary to
         display this item.  If anything else needs to be done once per
-        plot, it can be done here too.
+        plot, it can be done here too (but then '_cache_command' should
+        be set to false so that this method is called for each plot).
 
         """
 
-        return ' '.join([
+        if self._command is not None:
+            return self._command
+        command = ' '.join([
             self.get_base_command_string(),
             self.get_command_option_string(),
             ])
+        if self._cache_command:
+            self._command = command
+        return command
+
+    def prepare(self, gnuplot):
+        """Prepare gnuplot for a plot command that includes this item.
+
+        'gnuplot' is the 'Gnuplot' object that is about to plot the
+        item.  This method is called before the plot command is built
+        and can send any commands that must precede it (for example,
+        to define a datablock).  Can be overridden in derived classes.
+
+        """
+
+        pass
 
     def pipein(self, f):
         """Pipe necessary inline data to gnuplot.
@@ -223,6 +384,8 @@ class Func(PlotItem):
 
     """
 
+    __slots__ = ('function',)
+
     def __init__(self, function, **keyw):
         PlotItem.__init__(self, **keyw)
         self.function = function
@@ -250,6 +413,8 @@ class _FileItem(PlotItem):
             ),
         })
 
+    __slots__ = ('filename',)
+
     def __init__(self, filename, **keyw):
         """Represent a PlotItem that gnuplot treates as a file.
 
@@ -281,6 +446,10 @@ class _FileItem(PlotItem):
             'binary=<boolean>' -- data in the file is in binary format
                 (this option is only allowed for grid data for splot).
 
+            'binary=<string>' -- data in the file is in gnuplot's
+                general binary format, described by <string> (e.g.,
+                'array=(100,100) format="%float32"').
+
             'smooth=<string>' -- smooth the data.  Option should be
                 'unique', 'csplines', 'acsplines', 'bezier', or
                 'sbezier'.
@@ -318,7 +487,7 @@ class _FileItem(PlotItem):
                     subopts.append(str(subopt))
             self._options[name] = (
                 value,
-                '%s %s' % (name, ' '.join(subopts, ':'),),
+                '%s %s' % (name, ':'.join(subopts),),
                 )
         else:
             raise Errors.OptionError('%s=%s' % (name, value,))
@@ -328,13 +497,28 @@ class _FileItem(PlotItem):
             if not gp.GnuplotOpts.recognizes_binary_splot:
                 raise Errors.OptionError(
                     'Gnuplot.py is currently configured to reject binary data')
-            self._options['binary'] = (1, 'binary')
+            if isinstance(binary, str):
+                self._options['binary'] = (binary, 'binary %s' % (binary,))
+            else:
+                self._options['binary'] = (1, 'binary')
         else:
             self._options['binary'] = (0, None)
 
 
 class _NewFileItem(_FileItem):
-    def __init__(self, content, filename=None, **keyw):
+    """A _FileItem whose data are written to a new file.
+
+    'content' is the data as a string (or bytes, for binary data), or
+    a function that writes the data to the file object that is passed
+    to it.  If no filename is given, a temporary file is used, which
+    is deleted when the item is deleted (or when the temporary-file
+    session it belongs to is closed; see tempfiles.py).
+
+    """
+
+    __slots__ = ('temp', 'compress', '_session')
+
+    def __init__(self, content, filename=None, compress=None, **keyw):
 
         binary = keyw.get('binary', 0)
         if binary:
@@ -342,25 +526,48 @@ class _NewFileItem(_FileItem):
         else:
             mode = 'w'
 
-        if filename:
+        self.compress = compress
+        self._session = None
+        if compress:
+            if compress != 'gzip':
+                raise Errors.OptionError('compress=%s' % (compress,))
+            if not filename:
+                raise Errors.OptionError(
+                    'only data saved with filename can be compressed')
+            self.temp = False
+            f = open(filename, 'wb')
+            try:
+                if hasattr(content, '__call__'):
+                    # Compress the data as they are written:
+                    g = utils.GzipWriter(f)
+                    try:
+                        content(g)
+                    finally:
+                        g.close()
+                else:
+                    utils.write_gzip(f, content)
+            finally:
+                f.close()
+        elif filename:
             # This is a permanent file
             self.temp = False
             f = open(filename, mode)
         else:
             self.temp = True
-            if hasattr(tempfile, 'mkstemp'):
-                # Use the new secure method of creating temporary files:
-                (fd, filename,) = tempfile.mkstemp(
-                    suffix='.gnuplot', text=(not binary)
-                    )
-                f = os.fdopen(fd, mode)
-            else:
-                # for backwards compatibility to pre-2.3:
-                filename = tempfile.mktemp()
-                f = open(filename, mode)
+            self._session = tempfiles.current_session()
+            (fd, filename,) = self._session.mkstemp(
+                suffix='.gnuplot', text=(not binary)
+                )
+            f = os.fdopen(fd, mode)
 
-        f.write(content)
-        f.close()
+        if not compress:
+            try:
+                if hasattr(content, '__call__'):
+                    content(f)
+                else:
+                    f.write(content)
+            finally:
+                f.close()
 
         # If the user hasn't specified a title, set it to None so
         # that the name of the temporary file is not used:
@@ -369,17 +576,140 @@ class _NewFileItem(_FileItem):
 
         _FileItem.__init__(self, filename, **keyw)
 
+    def get_base_command_string(self):
+        if self.compress:
+            # Have gnuplot read the file through a pipe:
+            return gp.double_quote_string(
+                '< gzip -dc %s' % (_shell_quote(self.filename),)
+                )
+        else:
+            return gp.double_quote_string(self.filename)
+
+    def __del__(self):
+        # (__init__ might have failed before 'temp' was set.)
+        if getattr(self, 'temp', None):
+            self._session.remove(self.filename)
+
+
+class _SpilledContent(object):
+    """The content of a data item, moved from memory to a file.
+
+    The file belongs to the temporary-file session 'session' (that of
+    the item whose content it is).  It is created in the session's
+    directory within 'gp.GnuplotOpts.spill_dir' (in the session
+    directory itself if that is None) and deleted when this object is
+    deleted or the session is closed.
+
+    Members:
+
+        'filename' -- the name of the file holding the content.
+
+        'binary' -- true if the content is bytes rather than a string.
+
+    """
+
+    __slots__ = ('filename', 'binary', 'size', '_session')
+
+    def __init__(self, content, session):
+        self.binary = isinstance(content, bytes)
+        self.size = len(content)
+        self._session = session
+        (fd, self.filename) = self._session.mkstemp(
+            suffix='.gnuplot', dir=gp.GnuplotOpts.spill_dir,
+            text=(not self.binary),
+            )
+        f = os.fdopen(fd, self.binary and 'wb' or 'w')
+        try:
+            f.write(content)
+        finally:
+            f.close()
+
+    def __len__(self):
+        return self.size
+
+    def write(self, f, chunksize=2**20):
+        """Copy the content to the file object 'f'."""
+
+        source = open(self.filename, self.binary and 'rb' or 'r')
+        try:
+            shutil.copyfileobj(source, f, chunksize)
+        finally:
+            source.close()
+
     def __del__(self):
-        if self.temp:
-            os.unlink(self.filename)
+        if getattr(self, 'filename', None) is not None:
+            self._session.remove(self.filename)
+
+
+def _content_size(content):
+    """Return the number of bytes that 'content' takes when it is sent."""
+
+    if isinstance(content, bytes):
+        return len(content)
+    try:
+        if content.isascii():
+            return len(content)
+    except AttributeError:
+        # (Older Pythons have no isascii().)
+        pass
+    return len(content.encode('utf-8'))
+
+
+def _spill_wanted(spill):
+    """Decide whether an item's content should be moved to a file.
+
+    This is called after the content has been sent.  'spill' is the
+    value of the item's 'spill' option.  If it was not specified, the
+    content is spilled if the data of all items together take at least
+    'gp.GnuplotOpts.spill_threshold' bytes of memory (see budget.py).
+
+    """
+
+    if spill is _unset:
+        threshold = gp.GnuplotOpts.spill_threshold
+        return (
+            threshold is not None
+            and budget.memory_budget.total >= threshold
+            )
+    else:
+        return spill
+
+
+def _check_spill(keyw, inline, filename, datablock):
+    """Check the 'spill' option in 'keyw' of data sent as chosen.
+
+    Only inline and FIFO items keep their data in memory, so 'spill'
+    is rejected for data saved to a named file or sent as a datablock,
+    and removed from 'keyw' for data that are sent via a temporary
+    file.
+
+    """
+
+    if keyw.get('spill') and (filename or datablock):
+        raise Errors.OptionError(
+            'only inline and FIFO data can be spilled')
+    if not inline and (
+        filename or datablock or not gp.GnuplotOpts.prefer_fifo_data
+        ):
+        keyw.pop('spill', None)
 
 
 class _InlineFileItem(_FileItem):
     """A _FileItem that actually indicates inline data.
 
+    The content is normally kept in memory for as long as the item
+    exists, because it is needed again each time the item is plotted.
+    If the 'spill' option is true (by default, if the data of all
+    items take at least 'gp.GnuplotOpts.spill_threshold' bytes), the
+    content is moved to a file after it is sent to gnuplot and is copied
+    from there when it is needed again.  The file belongs to the
+    temporary-file session that was current when the item was created.
+
     """
 
-    def __init__(self, content, **keyw):
+    __slots__ = ('content', 'spill', '_session')
+
+    def __init__(self, content, spill=_unset, **keyw):
         # If the user hasn't specified a title, set it to None so that
         # '-' is not used:
         if 'title' not in keyw:
@@ -390,13 +720,94 @@ class _InlineFileItem(_FileItem):
 
         _FileItem.__init__(self, '-', **keyw)
 
+        self._session = tempfiles.current_session()
         if content[-1] == '\n':
             self.content = content
         else:
             self.content = content + '\n'
+        self.spill = spill
+        budget.memory_budget.register(self, _content_size(self.content))
+
+    def _spill_content(self):
+        # The content stays in memory if the item's session is closed:
+        if not (isinstance(self.content, _SpilledContent)
+                or self._session.closed):
+            self.content = _SpilledContent(self.content, self._session)
+            budget.memory_budget.register(self, 0)
 
     def pipein(self, f):
-        f.write(self.content + 'e\n')
+        if isinstance(self.content, _SpilledContent):
+            self.content.write(f)
+            f.write('e\n')
+        else:
+            f.write(self.content + 'e\n')
+            if _spill_wanted(self.spill):
+                self._spill_content()
+
+
+# Source of unique names for datablocks:
+_datablock_numbers = itertools.count(1)
+
+
+class _DatablockItem(_FileItem):
+    """A _FileItem whose data are stored in a gnuplot datablock.
+
+    The first time the item is plotted by a 'Gnuplot' object, its
+    content is uploaded to gnuplot as a named datablock (this requires
+    gnuplot 5.0 or later).  Afterwards the plot command refers to the
+    datablock by name, so 'replot' and 'hardcopy' do not transfer the
+    data again.  The datablock is replaced if the content is changed
+    with 'set_content', and freed when the item is deleted.  The
+    content is kept in memory (for uploading it to other 'Gnuplot'
+    objects), so it cannot be spilled to a file.
+
+    Members:
+
+        'content' -- the data, as a string in gnuplot's text format.
+
+        'version' -- incremented each time the content is changed.
+
+    """
+
+    __slots__ = ('content', 'version', '_sessions')
+
+    def __init__(self, content, **keyw):
+        # If the user hasn't specified a title, set it to None so that
+        # the name of the datablock is not used:
+        if 'title' not in keyw:
+            keyw['title'] = None
+
+        if keyw.get('binary', 0):
+            raise Errors.OptionError('binary datablocks are not supported')
+
+        self.version = 0
+        self._sessions = weakref.WeakKeyDictionary()
+        _FileItem.__init__(
+            self, '$Gnuplot_py_%d' % (next(_datablock_numbers),), **keyw
+            )
+        self.set_content(content)
+
+    def set_content(self, content):
+        """Replace the data; it is re-uploaded the next time it is plotted."""
+
+        if content[-1] != '\n':
+            content = content + '\n'
+        # (If the budget can't take the new content, the old one stays.)
+        budget.memory_budget.register(self, _content_size(content))
+        self.content = content
+        self.version += 1
+
+    def get_base_command_string(self):
+        return self.filename
+
+    def prepare(self, gnuplot):
+        gnuplot._define_datablock(self.filename, self.version, self.content)
+        self._sessions[gnuplot] = 1
+
+    def __del__(self):
+        # (__init__ might have failed before '_sessions' was set.)
+        for gnuplot in list(getattr(self, '_sessions', {}).keys()):
+            gnuplot._undefine_datablock(self.filename)
 
 
 if gp.GnuplotOpts.support_fifo:
@@ -413,26 +824,20 @@ if gp.GnuplotOpts.support_fifo:
 
         Since the tempfile module does not provide an easy, secure way
         to create a FIFO without race conditions, we instead create a
-        temporary directory using mkdtemp() then create the FIFO
-        within that directory.  When the writer thread has written the
-        full information to the FIFO, it deletes both the FIFO and the
-        temporary directory that contained it.
+        temporary directory (in the temporary-file session 'session')
+        then create the FIFO within that directory.  When the writer
+        thread has written the full information to the FIFO, it
+        deletes both the FIFO and the temporary directory that
+        contained it.
 
         """
 
-        def __init__(self, content, mode='w'):
+        def __init__(self, content, session, mode='w'):
             self.content = content
             self.mode = mode
-            if hasattr(tempfile, 'mkdtemp'):
-                # Make the file within a temporary directory that is
-                # created securely:
-                self.dirname = tempfile.mkdtemp(suffix='.gnuplot')
-                self.filename = os.path.join(self.dirname, 'fifo')
-            else:
-                # For backwards compatibility pre-2.3, just use
-                # mktemp() to create filename:
-                self.dirname = None
-                self.filename = tempfile.mktemp()
+            self.session = session
+            self.dirname = self.session.mkdtemp(suffix='.gnuplot')
+            self.filename = os.path.join(self.dirname, 'fifo')
             threading.Thread.__init__(
                 self,
                 name=('FIFO Writer for %s' % (self.filename,)),
@@ -442,11 +847,12 @@ if gp.GnuplotOpts.support_fifo:
 
         def run(self):
             f = open(self.filename, self.mode)
-            f.write(self.content)
+            if isinstance(self.content, _SpilledContent):
+                self.content.write(f)
+            else:
+                f.write(self.content)
             f.close()
-            os.unlink(self.filename)
-            if self.dirname is not None:
-                os.rmdir(self.dirname)
+            self.session.remove(self.dirname)
 
 
     class _FIFOFileItem(_FileItem):
@@ -455,20 +861,41 @@ if gp.GnuplotOpts.support_fifo:
         This class depends on the availablity of os.mkfifo(), which only
         exists under Unix.
 
+        The content is kept in memory or moved to a file after it is
+        first sent, as for '_InlineFileItem'.  The FIFOs and that file
+        belong to the temporary-file session that was current when the
+        item was created.
+
         """
 
-        def __init__(self, content, **keyw):
+        # A new FIFO is created for each plot command:
+        _cache_command = 0
+
+        __slots__ = ('content', 'mode', 'spill', '_session')
+
+        def __init__(self, content, spill=_unset, **keyw):
             # If the user hasn't specified a title, set it to None so that
             # the name of the temporary FIFO is not used:
             if 'title' not in keyw:
                 keyw['title'] = None
 
             _FileItem.__init__(self, '', **keyw)
+            self._session = tempfiles.current_session()
             self.content = content
+            self.spill = spill
             if keyw.get('binary', 0):
                 self.mode = 'wb'
             else:
                 self.mode = 'w'
+            budget.memory_budget.register(self, _content_size(content))
+
+        def _spill_content(self):
+            # The content stays in memory if the item's session is
+            # closed:
+            if not (isinstance(self.content, _SpilledContent)
+                    or self._session.closed):
+                self.content = _SpilledContent(self.content, self._session)
+                budget.memory_budget.register(self, 0)
 
         def get_base_command_string(self):
             """Create the gnuplot command for plotting this item.
@@ -480,7 +907,15 @@ if gp.GnuplotOpts.support_fifo:
 
             # Create a new FIFO and a thread to write to it.  Retrieve the
             # filename of the FIFO to be used in the basecommand.
-            fifo = _FIFOWriter(self.content, self.mode)
+            session = self._session
+            if session.closed:
+                # The FIFO only exists until it has been read, so any
+                # session will do:
+                session = tempfiles.current_session()
+            fifo = _FIFOWriter(self.content, session, self.mode)
+            if _spill_wanted(self.spill):
+                # The writer keeps the string until it has been sent:
+                self._spill_content()
             return gp.double_quote_string(fifo.filename)
 
 
@@ -496,13 +931,375 @@ def File(filename, **keyw):
 
     """
 
-    if isinstance(filename, str):
+    if not isinstance(filename, str):
         raise Errors.OptionError(
             'Argument (%s) must be a filename' % (filename,)
             )
     return _FileItem(filename, **keyw)
 
 
+def _decimate(columns, method, width):
+    """Return the rows of 'columns' that are kept by a decimation method.
+
+    'columns' is a list of 1-d arrays; the first holds x values in
+    increasing order and the others hold y values.
+
+    """
+
+    if columns is None or len(columns) < 2:
+        raise Errors.DataError(
+            'decimation requires data points with an x and a y value')
+    if not width or width < 1:
+        raise Errors.OptionError('decimation requires a positive width')
+
+    x = columns[0]
+    if len(columns) == 2:
+        y = columns[1]
+    else:
+        y = numpy.column_stack(columns[1:])
+    try:
+        if method == 'm4':
+            indices = utils.m4_indices(x, y, int(width))
+        elif method == 'lttb':
+            indices = utils.lttb_indices(x, columns[1], int(width))
+        else:
+            raise Errors.OptionError('decimate=%s' % (method,))
+    except ValueError as e:
+        raise Errors.DataError(str(e))
+    return [numpy.take(column, indices) for column in columns]
+
+
+def _int_columns(using):
+    """Return the columns named by a 'using' value as a list of ints.
+
+    Return None unless 'using' consists only of positive column
+    numbers (e.g., 3, (1,3), or '1:3').
+
+    """
+
+    if isinstance(using, int):
+        using = (using,)
+    elif isinstance(using, str):
+        using = using.split(':')
+    elif not isinstance(using, tuple):
+        return None
+    columns = []
+    for column in using:
+        if isinstance(column, str):
+            column = column.strip()
+            if not column.isdigit():
+                return None
+            column = int(column)
+        elif not isinstance(column, int):
+            return None
+        if column < 1:
+            return None
+        columns.append(column)
+    return columns
+
+
+def _every_slice(every):
+    """Return the slice of a single block of data selected by 'every'.
+
+    'every' is formatted as for the 'every' option.  Return None if it
+    refers to blocks other than the first.
+
+    """
+
+    if isinstance(every, int):
+        every = (every,)
+    elif isinstance(every, str):
+        every = every.split(':')
+    elif not isinstance(every, tuple):
+        return None
+    every = list(every) + [None] * (6 - len(every))
+    values = []
+    for value in every[:6]:
+        if isinstance(value, str):
+            value = value.strip() or None
+        try:
+            if value is not None:
+                value = int(value)
+        except ValueError:
+            return None
+        values.append(value)
+    (point_incr, block_incr, start, start_block, end, end_block) = values
+    if start_block or end_block:
+        return None
+    if end is not None:
+        end = end + 1
+    return slice(start, end, point_incr or 1)
+
+
+def _push_down(columns, keyw):
+    """Apply the 'every' and 'using' options of a data item in Python.
+
+    'columns' is a list of 1-d arrays holding the columns of the data,
+    which are to be written as a single block.  If 'keyw' selects
+    plain columns with 'using' and/or a stride with 'every', apply the
+    selection to 'columns' (without copying the data) and rewrite the
+    options so that gnuplot gets only the rows and columns that it
+    would use.  Return '(columns, culled)', where 'culled' is true if
+    the first two columns of the result are known to be the x and y
+    values plotted.
+
+    """
+
+    if 'using' in keyw:
+        using = _int_columns(keyw['using'])
+        if using is None or max(using) > len(columns):
+            return (columns, 0)
+        columns = [columns[column - 1] for column in using]
+        if len(using) == 1:
+            # Points are plotted against their line numbers, which
+            # must not be changed by 'every':
+            keyw['using'] = 1
+            return (columns, 0)
+        keyw['using'] = tuple(range(1, len(using) + 1))
+    elif len(columns) < 2:
+        return (columns, 0)
+
+    if 'every' in keyw:
+        rows = _every_slice(keyw['every'])
+        if rows is None:
+            return (columns, 0)
+        columns = [column[rows] for column in columns]
+        del keyw['every']
+    return (columns, 1)
+
+
+def _side(vals, limits):
+    """Return -1, 0 or 1 for each value below, within or above 'limits'."""
+
+    side = numpy.zeros(vals.shape, numpy.int8)
+    if limits is None:
+        return side
+    (lo, hi) = limits
+    if lo is not None and hi is not None and lo > hi:
+        (lo, hi) = (hi, lo)
+    if lo is not None:
+        side[vals < lo] = -1
+    if hi is not None:
+        side[vals > hi] = 1
+    return side
+
+
+def _cull(x, y, xrange, yrange):
+    """Return the indices of the points needed to plot within the ranges.
+
+    A point is kept if it lies within 'xrange' and 'yrange' (each a
+    tuple '(min, max)' as returned by 'Gnuplot.get_range()', or None)
+    or if a line from it to the previous or next point might cross
+    the plot area.  Thus the points just outside the plot area that
+    are needed to draw lines to its edges are kept.
+
+    """
+
+    xside = _side(x, xrange)
+    yside = _side(y, yrange)
+    keep = (xside == 0) & (yside == 0)
+    hidden = (
+        ((xside[:-1] == xside[1:]) & (xside[:-1] != 0))
+        | ((yside[:-1] == yside[1:]) & (yside[:-1] != 0))
+        )
+    keep[:-1] |= ~hidden
+    keep[1:] |= ~hidden
+    return numpy.nonzero(keep)[0]
+
+
+def _data_item(write, inline=0, filename=None, datablock=0, **keyw):
+    """Return a _FileItem that sends text data the way Data chose.
+
+    'write' is a function that writes the data to the file object
+    passed to it.  Data for files are written (and compressed)
+    directly to the file; otherwise they are first collected into a
+    string.
+
+    """
+
+    if filename:
+        return _NewFileItem(write, filename=filename, **keyw)
+    elif not (inline or datablock or gp.GnuplotOpts.prefer_fifo_data):
+        return _NewFileItem(write, **keyw)
+
+    f = StringIO()
+    write(f)
+    content = f.getvalue()
+    if inline:
+        return _InlineFileItem(content, **keyw)
+    elif datablock:
+        return _DatablockItem(content, **keyw)
+    else:
+        return _FIFOFileItem(content, **keyw)
+
+
+class _SelectingItem(_FileItem):
+    """A data item that chooses which data to send each time it is plotted.
+
+    Each time the item is plotted, 'select' is called with the
+    'xrange' and 'yrange' (or 'x2range' and 'y2range', depending on
+    the 'axes' option) most recently set with the Gnuplot object's
+    'set_range' method.  'select' stores an item that sends the chosen
+    data as '_item', to which sending the data is delegated; the other
+    options of the plot command (title, style, etc.) are this item's.
+
+    The keyword options named in '_transport_options' are not options
+    of this item; they are kept in the dictionary '_transport' and
+    passed to whatever creates '_item', to choose how the data are
+    sent.  The data of '_item' are accounted for in the memory budget
+    as this item's.  Nothing is selected until the item is first
+    plotted (or its command is built), so an item that is never
+    plotted costs nothing.  If the budget asks the item to drop its
+    data, they are selected again when it is next plotted.
+
+    This class is not meant to be used directly; derived classes
+    define 'select'.
+
+    Members:
+
+        'selection' -- a description of the data that were most
+            recently selected, or '_unset' if there are none.
+
+    """
+
+    # The data sent to gnuplot depend on the plot ranges:
+    _cache_command = 0
+
+    _transport_options = ('inline', 'datablock', 'spill')
+
+    def __init__(self, **keyw):
+        self._transport = {}
+        for option in self._transport_options:
+            if option in keyw:
+                self._transport[option] = keyw[option]
+                del keyw[option]
+
+        # If the user hasn't specified a title, set it to None so that
+        # the name of the temporary file is not used:
+        if 'title' not in keyw:
+            keyw['title'] = None
+
+        self.selection = _unset
+        self._item = None
+        _FileItem.__init__(self, '', **keyw)
+
+    def _selected(self):
+        """Return '_item', selecting all of the data if there is none."""
+
+        if self._item is None:
+            self.select()
+        return self._item
+
+    def _use(self, item):
+        """Have 'item' send the data, which are accounted for as ours."""
+
+        budget.memory_budget.adopt(self, item)
+        self._item = item
+
+    def _drop_content(self):
+        self.selection = _unset
+        self._item = None
+        budget.memory_budget.register(self, 0)
+
+    def _spill_content(self):
+        if hasattr(self._item, '_spill_content'):
+            self._item._spill_content()
+
+    def select(self, xrange=None, yrange=None):
+        """Choose the data to send for the given ranges.
+
+        'xrange' and 'yrange' are tuples '(min, max)' as returned by
+        'Gnuplot.get_range()' (either limit may be None, meaning
+        unlimited), or None.  This is called automatically each time
+        the item is plotted, but can also be called explicitly.  Must
+        be overridden in derived classes.
+
+        """
+
+        raise NotImplementedError()
+
+    def prepare(self, gnuplot):
+        axes = self._options.get('axes', ('x1y1', None))[0] or 'x1y1'
+        xaxis = axes[:2].replace('x1', 'x')
+        yaxis = axes[2:].replace('y1', 'y')
+        self.select(
+            gnuplot.get_range(xaxis + 'range'),
+            gnuplot.get_range(yaxis + 'range'),
+            )
+        self._selected().prepare(gnuplot)
+
+    def get_base_command_string(self):
+        return self._selected().get_base_command_string()
+
+    def pipein(self, f):
+        self._selected().pipein(f)
+
+
+class _CulledItem(_SelectingItem):
+    """A data item that sends only the points within the plot ranges.
+
+    Wherever points are left out, a blank line is written so that
+    gnuplot does not join the remaining points with a line.
+
+    The columns are copied, so changing the arrays that were passed in
+    doesn't change what is plotted.
+
+    This class is not meant to be used directly; see the 'cull'
+    option of 'Data'.
+
+    """
+
+    def __init__(self, columns, **keyw):
+        self.columns = [numpy.array(column) for column in columns]
+        _SelectingItem.__init__(self, **keyw)
+
+    def select(self, xrange=None, yrange=None):
+        """Choose the points to send (see '_cull()')."""
+
+        selection = (xrange, yrange)
+        if selection == self.selection:
+            return
+        indices = _cull(self.columns[0], self.columns[1], xrange, yrange)
+        if len(indices) == 0:
+            # gnuplot complains about empty data, so send one point:
+            indices = numpy.arange(1)
+        breaks = numpy.nonzero(numpy.diff(indices) > 1)[0] + 1
+        runs = numpy.split(indices, breaks)
+        columns = self.columns
+
+        def write(f):
+            for run in runs:
+                utils.write_columns(f, [
+                    column[run[0]:run[-1] + 1] for column in columns
+                    ])
+                # A blank line keeps gnuplot from joining the runs:
+                f.write('\n')
+
+        self._use(_data_item(write, **self._transport))
+        self.selection = selection
+
+
+def _quantize_dtype(quantize):
+    """Return the numpy type for a 'quantize' option value."""
+
+    try:
+        return {
+            'int8' : numpy.int8, 'uint8' : numpy.uint8,
+            'int16' : numpy.int16, 'uint16' : numpy.uint16,
+            }[quantize]
+    except KeyError:
+        raise Errors.OptionError('quantize=%s' % (quantize,))
+
+
+def _dequantize_expression(column, scale, offset, missing):
+    """Return a gnuplot 'using' expression undoing 'utils.quantize'."""
+
+    expression = '$%d*%r+%r' % (column, scale, offset,)
+    if missing is not None:
+        expression = '$%d==%d?NaN:%s' % (column, missing, expression,)
+    return '(%s)' % (expression,)
+
+
 def Data(*data, **keyw):
     """Create and return a _FileItem representing the data from *data.
 
@@ -531,17 +1328,82 @@ def Data(*data, **keyw):
             columns should be numbered in the python style (starting
             from 0), not the gnuplot style (starting from 1).
 
+        'decimate=<string>' -- send only a subset of the data points
+            that looks the same when plotted with lines.  The first
+            column of the data (after applying 'cols') must hold x
+            values in increasing order.  The methods are:
+
+            'm4' -- divide the x range into 'width' intervals and
+                keep the first and last point and the minimum and
+                maximum of each y column within each interval.  Best
+                for plots with lines.
+
+            'lttb' -- keep 'width' points chosen by the
+                Largest-Triangle-Three-Buckets algorithm applied to
+                the second column (see 'utils.lttb_indices').  Best
+                for scatter plots and smooth curves.
+
+        'width=<int>' -- the width of the plot in pixels, which is
+            the number of intervals or points used by 'decimate'.
+
+        'cull=<bool>' -- each time the item is plotted, send only the
+            points that can be seen within the ranges most recently
+            set with the Gnuplot object's 'set_range' method, plus
+            the neighboring points needed to draw lines to the edges
+            of the plot.  The x and y values must be the first two
+            columns (after applying 'cols' and 'using').  This option
+            is ignored for data with more than two dimensions, data
+            saved with 'filename', and data plotted with 'smooth'.
+            Not allowed with 'quantize'.
+
+        'quantize=<string>' -- send the data in binary format as
+            integers of type 'int8', 'uint8', 'int16', or 'uint16'
+            (1 or 2 bytes per value), which gnuplot scales back to the
+            original range of each column with a 'using' expression.
+            The error is at most 1/(2*(n-1)) of the range of the
+            column, where n is the number of distinct integers (256
+            or 65536), which is plenty for most plots.  Non-finite
+            values are sent as undefined values.  Quantized data can
+            only be sent via a file or FIFO.  If there are more than
+            two columns, 'using' must be specified (as a plain list
+            of columns).
+
         'inline=<bool>' -- transmit the data to gnuplot 'inline'
             rather than through a temporary file.  The default is the
             value of gp.GnuplotOpts.prefer_inline_data.
 
         'filename=<string>' -- save data to a permanent file.
 
+        'compress=<string>' -- if 'compress="gzip"', compress the
+            file saved with 'filename' (using several threads) and
+            have gnuplot read it through 'gzip -dc' (which must be
+            installed).
+
+        'datablock=<bool>' -- upload the data to gnuplot once as a
+            named datablock, and refer to it by name in subsequent
+            plot commands.  Requires gnuplot 5.0 or later.  The
+            default is the value of
+            gp.GnuplotOpts.prefer_datablock_data.
+
+        'spill=<bool>' -- after inline or FIFO data are sent to
+            gnuplot, move them from memory to a file (in
+            gp.GnuplotOpts.spill_dir) and copy them from there when
+            the item is plotted again.  By default, data are spilled
+            once the data of all items take at least
+            gp.GnuplotOpts.spill_threshold bytes of memory.  Not
+            allowed with 'filename' or 'datablock'.
+
     The keyword arguments recognized by '_FileItem' can also be used
-    here.
+    here.  If the data are 1- or 2-dimensional and 'using' selects
+    plain columns (e.g., 'using=(1,3)'), only those columns are sent
+    to gnuplot, and a simple 'every' option (one that doesn't refer to
+    blocks) is likewise applied before the data are sent.
 
     """
 
+    # 1- and 2-dimensional data are handled as a list of columns,
+    # each of which refers to the original data where possible:
+    columns = None
     if len(data) == 1:
         # data was passed as a single structure
         data = utils.float_array(data[0])
@@ -550,27 +1412,83 @@ def Data(*data, **keyw):
         # treated as one value per point (by default, plotted against
         # its index):
         if len(data.shape) == 1:
-            data = data[:,numpy.newaxis]
+            columns = [data]
+        elif len(data.shape) == 2:
+            columns = [data[:,i] for i in range(data.shape[1])]
     else:
-        # data was passed column by column (for example,
-        # Data(x,y)); pack it into one big array (this will test
-        # that sizes are all the same):
-        data = utils.float_array(data)
-        dims = len(data.shape)
-        # transpose so that the last index selects x vs. y:
-        data = numpy.transpose(data, (dims-1,) + tuple(range(dims-1)))
+        # data was passed column by column (for example, Data(x,y)):
+        arrays = [utils.float_array(column) for column in data]
+        for column in arrays[1:]:
+            if column.shape != arrays[0].shape:
+                raise Errors.DataError(
+                    'data columns must all have the same shape')
+        if len(arrays[0].shape) == 1:
+            columns = arrays
+        else:
+            # pack them into one big array:
+            data = numpy.array(arrays)
+            dims = len(data.shape)
+            # transpose so that the last index selects x vs. y:
+            data = numpy.transpose(data, (dims-1,) + tuple(range(dims-1)))
     if 'cols' in keyw:
         cols = keyw['cols']
         del keyw['cols']
-        if isinstance(cols, types.IntType):
+        if isinstance(cols, int):
             cols = (cols,)
-        data = numpy.take(data, cols, -1)
+        if columns is None:
+            data = numpy.take(data, cols, -1)
+        else:
+            columns = [columns[col] for col in cols]
+
+    if columns is None:
+        culled = 0
+    else:
+        (columns, culled) = _push_down(columns, keyw)
+
+    if 'cull' in keyw:
+        cull = keyw['cull']
+        del keyw['cull']
+    else:
+        cull = 0
+
+    if 'decimate' in keyw:
+        method = keyw['decimate']
+        del keyw['decimate']
+        width = keyw.get('width')
+        if 'width' in keyw:
+            del keyw['width']
+        columns = _decimate(columns, method, width)
+
+    if 'quantize' in keyw:
+        quantize = keyw['quantize']
+        del keyw['quantize']
+    else:
+        quantize = None
 
     if 'filename' in keyw:
         filename = keyw['filename'] or None
         del keyw['filename']
     else:
         filename = None
+    if keyw.get('compress') and not filename:
+        raise Errors.OptionError(
+            'only data saved with filename can be compressed')
+    elif not keyw.get('compress'):
+        # (Only _NewFileItem recognizes the option, even if it is off.)
+        keyw.pop('compress', None)
+
+    if 'datablock' in keyw:
+        datablock = keyw['datablock']
+        del keyw['datablock']
+        if datablock and filename:
+            raise Errors.OptionError(
+                'cannot pass data both as a datablock and via a file'
+                )
+    else:
+        datablock = (
+            (not filename) and (not quantize) and ('inline' not in keyw)
+            and gp.GnuplotOpts.prefer_datablock_data
+            )
 
     if 'inline' in keyw:
         inline = keyw['inline']
@@ -579,25 +1497,78 @@ def Data(*data, **keyw):
             raise Errors.OptionError(
                 'cannot pass data both inline and via a file'
                 )
+        if inline and datablock:
+            raise Errors.OptionError(
+                'cannot pass data both inline and as a datablock'
+                )
     else:
-        inline = (not filename) and gp.GnuplotOpts.prefer_inline_data
+        inline = (
+            (not filename) and (not datablock) and (not quantize)
+            and gp.GnuplotOpts.prefer_inline_data
+            )
+    _check_spill(keyw, inline, filename, datablock)
 
-    # Output the content into a string:
-    f = StringIO()
-    utils.write_array(f, data)
-    content = f.getvalue()
-    if inline:
-        return _InlineFileItem(content, **keyw)
-    elif filename:
-        return _NewFileItem(content, filename=filename, **keyw)
-    elif gp.GnuplotOpts.prefer_fifo_data:
-        return _FIFOFileItem(content, **keyw)
+    if quantize:
+        if inline or datablock:
+            raise Errors.OptionError(
+                'quantized data can only be passed via a file'
+                )
+        if cull:
+            raise Errors.OptionError('quantized data cannot be culled')
+        if columns is None:
+            raise Errors.DataError(
+                'quantized data must be 1- or 2-dimensional')
+        if 'using' in keyw:
+            using = _int_columns(keyw['using'])
+            if using is None:
+                raise Errors.OptionError(
+                    'quantized data require a plain column list for using')
+        elif len(columns) <= 2:
+            using = list(range(1, len(columns) + 1))
+        else:
+            raise Errors.OptionError(
+                'quantized data with more than two columns require using')
+        dtype = _quantize_dtype(quantize)
+        points = len(columns[0])
+        codes = numpy.empty((points, len(columns)), dtype)
+        expressions = {}
+        for i in range(len(columns)):
+            (codes[:,i], scale, offset, missing) = utils.quantize(
+                columns[i], dtype
+                )
+            expressions[i + 1] = _dequantize_expression(
+                i + 1, scale, offset, missing
+                )
+        keyw['using'] = ':'.join([expressions[column] for column in using])
+        keyw['binary'] = 'record=(%d) format="%s"' % (
+            points, ('%%%s' % (quantize,)) * len(columns),
+            )
+        content = codes.tobytes()
+        if (not filename) and gp.GnuplotOpts.prefer_fifo_data:
+            return _FIFOFileItem(content, **keyw)
+        else:
+            return _NewFileItem(content, filename=filename, **keyw)
+
+    if cull and culled and not filename and 'smooth' not in keyw:
+        return _CulledItem(
+            columns, inline=inline, datablock=datablock, **keyw
+            )
+
+    if columns is None:
+        def write(f):
+            utils.write_array(f, data)
     else:
-        return _NewFileItem(content, **keyw)
+        def write(f):
+            # This writes the same lines as write_array would for the
+            # stacked columns, including the blank line at the end:
+            utils.write_columns(f, columns)
+            f.write('\n')
+    return _data_item(write, inline, filename, datablock, **keyw)
 
 
 def GridData(
-    data, xvals=None, yvals=None, inline=_unset, filename=None, **keyw
+    data, xvals=None, yvals=None, inline=_unset, filename=None,
+    datablock=_unset, quantize=None, **keyw
     ):
     """Return a _FileItem representing a function of two variables.
 
@@ -620,6 +1591,20 @@ def GridData(
 
         'filename=<string>' -- save data to a permanent file.
 
+        'compress=<string>' -- compress the file saved with
+            'filename' (see 'Data').
+
+        'datablock=<bool>' -- send data to gnuplot as a named
+            datablock (only for text data; see 'Data').
+
+        'spill=<bool>' -- move inline or FIFO data to a file after
+            they are sent (see 'Data').
+
+        'quantize=<string>' -- send data to gnuplot in binary format
+            as integers of the given type (see 'Data').  This requires
+            'xvals' and 'yvals' to be evenly spaced, and the result is
+            only suitable for 'splot'.
+
     Note the unusual argument order!  The data are specified *before*
     the x and y values.  (This inconsistency was probably a mistake;
     after all, the default xvals and yvals are not very useful.)
@@ -677,25 +1662,87 @@ def GridData(
                 'The size of yvals must be the same as the size of '
                 'the second dimension of the data array')
 
+    if keyw.get('compress') and not filename:
+        raise Errors.OptionError(
+            'only data saved with filename can be compressed')
+    elif not keyw.get('compress'):
+        # (Only _NewFileItem recognizes the option, even if it is off.)
+        keyw.pop('compress', None)
+
     # Binary defaults to true if recognizes_binary_plot is set;
     # otherwise it is forced to false.
     binary = keyw.get('binary', 1) and gp.GnuplotOpts.recognizes_binary_splot
     keyw['binary'] = binary
 
+    if datablock is _unset:
+        datablock = (
+            (not binary) and (not filename) and (inline is _unset)
+            and gp.GnuplotOpts.prefer_datablock_data
+            )
+    elif datablock and filename:
+        raise Errors.OptionError(
+            'cannot pass data both as a datablock and via a file'
+            )
+
     if inline is _unset:
         inline = (
-            (not binary) and (not filename)
+            (not binary) and (not filename) and (not datablock)
             and gp.GnuplotOpts.prefer_inline_data
             )
     elif inline and filename:
         raise Errors.OptionError(
             'cannot pass data both inline and via a file'
             )
+    elif inline and datablock:
+        raise Errors.OptionError(
+            'cannot pass data both inline and as a datablock'
+            )
+    _check_spill(keyw, inline, filename, datablock)
 
     # xvals, yvals, and data are now all filled with arrays of data.
-    if binary:
+    if binary and quantize:
+        if inline or datablock:
+            raise Errors.OptionError(
+                'quantized data can only be passed via a file'
+                )
+        if 'using' in keyw:
+            raise Errors.OptionError(
+                'the using option cannot be combined with quantize')
+        steps = []
+        for vals in [xvals, yvals]:
+            if len(vals) < 2:
+                steps.append(1.0)
+                continue
+            step = (float(vals[-1]) - float(vals[0])) / (len(vals) - 1)
+            if numpy.any(
+                numpy.abs(numpy.diff(vals) - step) > 1.0e-6 * abs(step)
+                ):
+                raise Errors.DataError(
+                    'quantized grid data require evenly-spaced '
+                    'xvals and yvals')
+            steps.append(step)
+
+        dtype = _quantize_dtype(quantize)
+        (codes, scale, offset, missing) = utils.quantize(data, dtype)
+        # gnuplot expects the values one row (constant y) at a time:
+        content = numpy.ascontiguousarray(numpy.transpose(codes)).tobytes()
+        keyw['binary'] = (
+            'array=(%d,%d) dx=%r dy=%r origin=(%r,%r,0.0) format="%%%s"'
+            % (numx, numy, steps[0], steps[1],
+               float(xvals[0]), float(yvals[0]), quantize,)
+            )
+        keyw['using'] = _dequantize_expression(1, scale, offset, missing)
+        if (not filename) and gp.GnuplotOpts.prefer_fifo_data:
+            return _FIFOFileItem(content, **keyw)
+        else:
+            return _NewFileItem(content, filename=filename, **keyw)
+    elif quantize:
+        raise Errors.OptionError('quantized data must be binary')
+    elif binary:
         if inline:
             raise Errors.OptionError('binary inline data not supported')
+        if datablock:
+            raise Errors.OptionError('binary datablocks are not supported')
 
         # write file in binary format
 
@@ -716,35 +1763,442 @@ def GridData(
             # must be necessary:
             mout[1:,1:] = numpy.transpose(data.astype(numpy.float32))
 
-        content = mout.tostring()
+        content = mout.tobytes()
         if (not filename) and gp.GnuplotOpts.prefer_fifo_data:
             return _FIFOFileItem(content, **keyw)
         else:
             return _NewFileItem(content, filename=filename, **keyw)
     else:
-        # output data to file as "x y f(x)" triplets.  This
-        # requires numy copies of each x value and numx copies of
-        # each y value.  First reformat the data:
-        set = numpy.transpose(
-            numpy.array(
-                (numpy.transpose(numpy.resize(xvals, (numy, numx))),
-                 numpy.resize(yvals, (numx, numy)),
-                 data)), (1,2,0))
-
-        # Now output the data with the usual routine.  This will
-        # produce data properly formatted in blocks separated by blank
-        # lines so that gnuplot can connect the points into a grid.
-        f = StringIO()
-        utils.write_array(f, set)
-        content = f.getvalue()
+        # output data to file as "x y f(x)" triplets, in blocks
+        # separated by blank lines so that gnuplot can connect the
+        # points into a grid.  The triplets are formatted a few rows
+        # at a time rather than all being built in memory first:
+        def write(f):
+            utils.write_grid(f, xvals, yvals, data)
 
-        if inline:
-            return _InlineFileItem(content, **keyw)
-        elif filename:
-            return _NewFileItem(content, filename=filename, **keyw)
-        elif gp.GnuplotOpts.prefer_fifo_data:
-            return _FIFOFileItem(content, **keyw)
+        return _data_item(write, inline, filename, datablock, **keyw)
+
+
+def _halve(a, axis, method):
+    """Combine neighboring pairs of elements of 'a' along 'axis'.
+
+    'method' is 'mean' or 'max'.  If the length along 'axis' is odd,
+    the last element is kept as it is.
+
+    """
+
+    n = a.shape[axis]
+    index = [slice(None)] * a.ndim
+    index[axis] = slice(0, n - n % 2)
+    shape = a.shape[:axis] + (n // 2, 2) + a.shape[axis + 1:]
+    pairs = a[tuple(index)].reshape(shape)
+    if method == 'mean':
+        result = pairs.mean(axis + 1)
+    elif method == 'max':
+        result = numpy.fmax.reduce(pairs, axis + 1)
+    else:
+        raise Errors.OptionError('method=%s' % (method,))
+    if n % 2:
+        index[axis] = slice(n - 1, n)
+        result = numpy.concatenate((result, a[tuple(index)]), axis)
+    return result
+
+
+def _visible(vals, limits):
+    """Return the slice of the increasing array 'vals' within 'limits'.
+
+    'limits' is a tuple '(min, max)' (either of which may be None) or
+    None.  The returned indices '(start, stop)' include one extra
+    value on each side, so that the plot extends to the edge of the
+    range.  At least two values are always included.
+
+    """
+
+    n = len(vals)
+    if limits is None or n < 2 or vals[0] > vals[-1]:
+        return (0, n)
+    (lo, hi) = limits
+    if lo is not None and hi is not None and lo > hi:
+        (lo, hi) = (hi, lo)
+    start = 0
+    if lo is not None:
+        start = max(numpy.searchsorted(vals, lo, 'right') - 1, 0)
+    stop = n
+    if hi is not None:
+        stop = min(numpy.searchsorted(vals, hi, 'left') + 1, n)
+    start = min(start, n - 2)
+    stop = max(stop, start + 2)
+    return (int(start), int(stop))
+
+
+class GridPyramid(_SelectingItem):
+    """Grid data that is sent to gnuplot at a resolution suited to the plot.
+
+    A 'GridPyramid' holds a function of two variables tabulated on a
+    grid, like 'GridData', along with a series of coarser versions of
+    the grid (a "mipmap pyramid").  Each level combines pairs of cells
+    of the next finer level along each axis that is still larger than
+    the plot ('width' in x, 'height' in y), so each cell combines 2x2,
+    2x1, or 1x2 cells.  Each time the item is plotted, it looks up the
+    'xrange' and 'yrange' most recently set with the Gnuplot object's
+    'set_range' method, and sends only the part of the coarsest level
+    that still has at least 'width' x 'height' cells within those
+    ranges (or as many as the original grid has there).  Thus a huge
+    grid can be plotted quickly, and zooming in automatically uses
+    finer levels.
+
+    Members:
+
+        'levels' -- a list of '(data, xvals, yvals)' tuples, one per
+            level, starting with the original grid.
+
+        'selection' -- a tuple '(level, xstart, xstop, ystart,
+            ystop)' describing the part of the pyramid sent most
+            recently.
+
+    """
+
+    def __init__(self, data, xvals=None, yvals=None,
+                 method='mean', width=800, height=600, directory=None,
+                 **keyw):
+        """Construct a 'GridPyramid'.
+
+        'data', 'xvals', and 'yvals' are as for 'GridData', except
+        that 'xvals' and 'yvals' must be in increasing order.
+
+        Keyword arguments:
+
+            'method=<string>' -- how cells are combined into the cells
+                of the next level: 'mean' (the default) or 'max'.
+
+            'width=<int>', 'height=<int>' -- the size of the plot in
+                pixels.  Coarser levels are built until one fits
+                within this size.
+
+            'directory=<string>' -- a directory in which to save the
+                coarser levels, so that they don't have to be built
+                again the next time a 'GridPyramid' is created for the
+                same data with the same 'method'.  (It is up to the
+                caller to use a different directory if the data
+                change.)  The levels are loaded with 'numpy.load' in
+                memory-mapped mode.
+
+            'binary=<bool>', 'inline=<bool>', 'datablock=<bool>' --
+                how the data are sent to gnuplot; see 'GridData'.
+
+        The keyword arguments recognized by '_FileItem' can also be
+        used here.
+
+        """
+
+        data = utils.float_array(data)
+        try:
+            (numx, numy) = data.shape
+        except ValueError:
+            raise Errors.DataError('data array must be two-dimensional')
+        if xvals is None:
+            xvals = numpy.arange(numx, dtype=numpy.float64)
         else:
-            return _NewFileItem(content, **keyw)
+            xvals = utils.float_array(xvals)
+        if yvals is None:
+            yvals = numpy.arange(numy, dtype=numpy.float64)
+        else:
+            yvals = utils.float_array(yvals)
+        if xvals.shape != (numx,) or yvals.shape != (numy,):
+            raise Errors.DataError(
+                'The sizes of xvals and yvals must match the dimensions '
+                'of the data array')
+
+        self.levels = [(data, xvals, yvals)]
+        if directory is not None:
+            self._load_levels(directory, method)
+        if len(self.levels) == 1:
+            while numx > width or numy > height:
+                # Only halve the axes that are still too large:
+                if numx > width:
+                    data = _halve(data, 0, method)
+                    xvals = _halve(xvals, 0, 'mean')
+                if numy > height:
+                    data = _halve(data, 1, method)
+                    yvals = _halve(yvals, 0, 'mean')
+                (numx, numy) = data.shape
+                self.levels.append((data, xvals, yvals))
+            if directory is not None:
+                self._save_levels(directory, method)
+
+        self.width = width
+        self.height = height
+
+        # Binary defaults to true if recognizes_binary_plot is set;
+        # otherwise it is forced to false.
+        keyw['binary'] = (
+            keyw.get('binary', 1) and gp.GnuplotOpts.recognizes_binary_splot
+            )
+        _SelectingItem.__init__(self, **keyw)
+
+    def _level_filenames(self, directory, method, level):
+        prefix = os.path.join(directory, '%s%d' % (method, level,))
+        return [prefix + '.npy', prefix + '_x.npy', prefix + '_y.npy']
+
+    def _load_levels(self, directory, method):
+        level = 1
+        while True:
+            filenames = self._level_filenames(directory, method, level)
+            if not os.path.exists(filenames[0]):
+                break
+            self.levels.append(tuple([
+                numpy.load(filename, mmap_mode='r') for filename in filenames
+                ]))
+            level += 1
+
+    def _save_levels(self, directory, method):
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for level in range(1, len(self.levels)):
+            filenames = self._level_filenames(directory, method, level)
+            for (filename, a) in zip(filenames, self.levels[level]):
+                numpy.save(filename, a)
+
+    def select(self, xrange=None, yrange=None):
+        """Choose the part of the pyramid to send for the given ranges."""
+
+        # Where the original grid has fewer cells than the plot, ask
+        # for no more than it has:
+        (data, xvals, yvals) = self.levels[0]
+        (xstart, xstop) = _visible(xvals, xrange)
+        (ystart, ystop) = _visible(yvals, yrange)
+        width = min(self.width, xstop - xstart)
+        height = min(self.height, ystop - ystart)
+        for level in range(len(self.levels) - 1, -1, -1):
+            (data, xvals, yvals) = self.levels[level]
+            (xstart, xstop) = _visible(xvals, xrange)
+            (ystart, ystop) = _visible(yvals, yrange)
+            if xstop - xstart >= width and ystop - ystart >= height:
+                break
+
+        selection = (level, xstart, xstop, ystart, ystop)
+        if selection != self.selection:
+            self._use(GridData(
+                data[xstart:xstop, ystart:ystop],
+                xvals[xstart:xstop], yvals[ystart:ystop],
+                binary=self.get_option('binary'), **self._transport
+                ))
+            self.selection = selection
+
+
+class ZoomData(_SelectingItem):
+    """A long series that is decimated for the x range being plotted.
+
+    A 'ZoomData' holds a series of points '(x, y)' with 'x' in
+    increasing order, together with a 'utils.MinMaxIndex' built for
+    it.  Each time the item is plotted, it looks up the 'xrange' most
+    recently set with the Gnuplot object's 'set_range' method and uses
+    the index to send only the points needed to draw the part of the
+    series within that range with lines 'width' pixels wide.  Thus
+    each change of the range costs time proportional to 'width'
+    rather than to the number of points in the series.
+
+    Members:
+
+        'index' -- the 'utils.MinMaxIndex'.
+
+        'selection' -- the x range for which the data were most
+            recently selected.
+
+    """
 
+    def __init__(self, x, y, width=800, directory=None, index=None, **keyw):
+        """Construct a 'ZoomData' for the series 'x', 'y'.
 
+        'x' and 'y' are 1-d arrays of the same length (they may be
+        'numpy.memmap's).
+
+        Keyword arguments:
+
+            'width=<int>' -- the width of the plot in pixels.
+
+            'directory=<string>' -- a directory in which the index is
+                saved, so that it is only built the first time a
+                'ZoomData' is created for the series.  (It is up to
+                the caller to use a different directory if the data
+                change.)
+
+            'index=<MinMaxIndex>' -- use an index that has already
+                been built for 'x' and 'y'.
+
+            'inline=<bool>', 'datablock=<bool>' -- how the data are
+                sent to gnuplot; see 'Data'.
+
+        The keyword arguments recognized by '_FileItem' can also be
+        used here.
+
+        """
+
+        if index is None:
+            try:
+                index = utils.MinMaxIndex(x, y, directory)
+            except ValueError as e:
+                raise Errors.DataError(str(e))
+        self.index = index
+        self.width = width
+        _SelectingItem.__init__(self, **keyw)
+
+    def select(self, xrange=None, yrange=None):
+        """Choose the points to send for 'xrange' ('yrange' is ignored)."""
+
+        if xrange == self.selection:
+            return
+        (xmin, xmax) = xrange or (None, None)
+        if xmin is not None and xmax is not None and xmin > xmax:
+            (xmin, xmax) = (xmax, xmin)
+        indices = self.index.select(xmin, xmax, self.width)
+        if len(indices) == 0:
+            indices = numpy.arange(1)
+        self._use(Data(
+            self.index.x[indices], self.index.y[indices], **self._transport
+            ))
+        self.selection = xrange
+
+
+def Histogram(data, bins=10, range=None, weights=None,
+              cumulative=0, density=0, chunksize=None, **keyw):
+    """Return a PlotItem showing a histogram of the values in 'data'.
+
+    The histogram is computed by numpy, and only the resulting table
+    of bins is sent to gnuplot, so the amount of data transferred
+    does not depend on the number of samples.  Each bin is sent as a
+    line 'center value width', and by default is plotted 'with boxes'
+    (which takes the width of each box from the third column).
+
+    Arguments:
+
+        'data' -- an array of samples (of any shape).  It may be a
+            'numpy.memmap' (see 'chunksize').
+
+        'bins=<int or sequence>' -- the number of equal-width bins,
+            or a sequence of bin edges, as for 'numpy.histogram'.
+
+        'range=<tuple>' -- '(min, max)' of the bins if 'bins' is an
+            integer.  By default the range of the data is used.
+
+        'weights=<array>' -- an array of the same shape as 'data'
+            giving the weight of each sample.
+
+        'cumulative=<bool>' -- show the cumulative distribution.
+
+        'density=<bool>' -- normalize so that the area of the
+            histogram is 1 (or, with 'cumulative', so that it rises to
+            1).
+
+        'chunksize=<int>' -- process this many samples at a time (see
+            'utils.histogram').
+
+    The other keyword arguments are passed to 'Data'.
+
+    """
+
+    (counts, edges) = utils.histogram(data, bins, range, weights, chunksize)
+    widths = numpy.diff(edges)
+    counts = counts.astype(numpy.float64)
+    if density:
+        total = counts.sum()
+        if total:
+            counts /= total
+            if not cumulative:
+                counts /= widths
+    if cumulative:
+        counts = numpy.cumsum(counts)
+    if 'with_' not in keyw and 'with' not in keyw:
+        keyw['with_'] = 'boxes'
+    return Data((edges[:-1] + edges[1:]) / 2.0, counts, widths, **keyw)
+
+
+def Density2D(x, y, z=None, bins=512, range=None, statistic='count',
+              log=0, chunksize=None, filename=None, **keyw):
+    """Return a PlotItem showing the density of a large set of points.
+
+    Plotting tens of millions of points individually overwhelms
+    gnuplot.  Instead, 'Density2D' bins the points (x, y) into a
+    raster with numpy and sends the raster to gnuplot as a binary
+    image, so that the work done by gnuplot depends only on the
+    number of cells.  By default the item is plotted 'with image'.
+
+    Arguments:
+
+        'x', 'y' -- arrays of the coordinates of the points.  They may
+            be 'numpy.memmap's; the points are processed 'chunksize'
+            at a time (see 'utils.bin2d').
+
+        'z' -- an optional array holding a value for each point, used
+            by 'statistic="mean"'.
+
+        'bins=<int or tuple>' -- the number of cells in the x and y
+            directions (e.g., the size of the plot in pixels).
+
+        'range=<tuple>' -- '((xmin, xmax), (ymin, ymax))'.  The
+            default is the range of the data.
+
+        'statistic=<string>' -- what is shown for each cell: 'count'
+            (the number of points) or 'mean' (the average of the 'z'
+            values of the points).  Empty cells are NaN for 'mean'.
+
+        'log=<bool>' -- show the base-10 logarithm of the statistic.
+            Cells where it is not positive become NaN.
+
+        'filename=<string>' -- save the raster to a permanent file.
+
+        'spill=<bool>' -- as for 'Data'; it only applies if the
+            raster is sent through a FIFO.
+
+    The other keyword arguments are passed to the '_FileItem'
+    constructor.
+
+    """
+
+    if isinstance(bins, int):
+        bins = (bins, bins)
+    if statistic == 'count':
+        values = None
+    elif statistic == 'mean':
+        if z is None:
+            raise Errors.OptionError('statistic="mean" requires z values')
+        values = z
+    else:
+        raise Errors.OptionError('statistic=%s' % (statistic,))
+
+    try:
+        (counts, sums, xedges, yedges) = utils.bin2d(
+            x, y, bins, range, values, chunksize
+            )
+    except ValueError as e:
+        raise Errors.OptionError(str(e))
+    old_settings = numpy.seterr(divide='ignore', invalid='ignore')
+    try:
+        if sums is None:
+            image = counts.astype(numpy.float64)
+        else:
+            image = sums / counts
+        if log:
+            image = numpy.where(image > 0, numpy.log10(image), numpy.nan)
+    finally:
+        numpy.seterr(**old_settings)
+
+    # gnuplot expects the image one row (constant y) at a time:
+    content = numpy.ascontiguousarray(
+        numpy.transpose(image), numpy.float32
+        ).tobytes()
+    dx = float(xedges[1] - xedges[0])
+    dy = float(yedges[1] - yedges[0])
+    keyw['binary'] = (
+        'array=(%d,%d) dx=%r dy=%r origin=(%r,%r) format="%%float32"'
+        % (bins[0], bins[1], dx, dy,
+           float(xedges[0]) + dx / 2.0, float(yedges[0]) + dy / 2.0,)
+        )
+    if 'with_' not in keyw and 'with' not in keyw:
+        keyw['with_'] = 'image'
+
+    _check_spill(keyw, 0, filename, 0)
+    if (not filename) and gp.GnuplotOpts.prefer_fifo_data:
+        return _FIFOFileItem(content, **keyw)
+    else:
+        return _NewFileItem(content, filename=filename, **keyw)
@@ -14,7 +14,77 @@ interface to a running gnuplot process.
 
 import sys, string, types
 
-import gp, PlotItems, termdefs, Errors
+import gp, PlotItems, termdefs, budget, tempfiles, Errors
+
+
+# The options that 'set' and 'unset' commands might change a range
+# through (gnuplot accepts any unambiguous abbreviation):
+_range_options = [
+    'xrange', 'yrange', 'zrange', 'x2range', 'y2range', 'cbrange',
+    'rrange', 'trange', 'urange', 'vrange', 'autoscale',
+    ]
+
+# Commands that don't change any ranges:
+_rangeless_commands = [
+    'plot', 'splot', 'replot', 'show', 'print', 'pause', 'clear',
+    'save', 'refresh', 'test', 'pwd', 'help',
+    ]
+
+
+def _changes_ranges(s):
+    """Return true if the gnuplot commands in 's' might change a range.
+
+    A 'set' or 'unset' command changes a range only if its option is
+    a range or 'autoscale'.  Other commands are assumed to change
+    ranges unless they are known not to.
+
+    """
+
+    for command in s.split(';'):
+        words = command.replace('[', ' [').split()
+        if not words:
+            continue
+        verb = words[0].lower()
+        if (len(verb) >= 2 and 'set'.startswith(verb)) or (
+            len(verb) >= 3 and 'unset'.startswith(verb)
+            ):
+            if len(words) < 2:
+                return 1
+            option = words[1].lower()
+            if option.startswith('no'):
+                # e.g., 'set noautoscale':
+                option = option[2:]
+            for name in _range_options:
+                if name.startswith(option):
+                    return 1
+        else:
+            for name in _rangeless_commands:
+                if name.startswith(verb):
+                    break
+            else:
+                return 1
+    return 0
+
+
+def _drops_datablocks(s):
+    """Return true if the gnuplot commands in 's' might delete datablocks.
+
+    Datablocks are deleted by 'undefine' and by 'reset session' (or
+    any unambiguous abbreviation of them, e.g., 'undef $data').
+
+    """
+
+    for command in s.split(';'):
+        words = command.split()
+        if not words:
+            continue
+        verb = words[0].lower()
+        if len(verb) >= 3 and 'undefine'.startswith(verb):
+            return 1
+        if len(verb) >= 3 and 'reset'.startswith(verb) and len(words) >= 2:
+            if 'session'.startswith(words[1].lower()):
+                return 1
+    return 0
 
 
 class _GnuplotFile:
@@ -40,6 +110,8 @@ class _GnuplotFile:
 
         'flush' -- cause pending output to be written immediately.
 
+        'close' -- close the file.
+
     """
 
     def __init__(self, filename):
@@ -50,6 +122,9 @@ class _GnuplotFile:
         self.write = self.gnuplot.write
         self.flush = self.gnuplot.flush
 
+    def close(self):
+        self.gnuplot.close()
+
     def __call__(self, s):
         """Write a command string to the file, followed by newline."""
 
@@ -104,6 +179,11 @@ class Gnuplot:
         'plotcmd' -- 'plot' or 'splot', depending on what was the last
             plot command.
 
+        'tempfiles' -- the 'tempfiles.TempSession' holding the
+            temporary files of the items created within a 'with'
+            statement (and by 'plot' for arrays).  The files are
+            deleted by 'close'.
+
     Methods:
 
         '__init__' -- if a filename argument is specified, the
@@ -154,11 +234,37 @@ class Gnuplot:
         'set_string' -- set or unset a gnuplot option whose value is a
             string.
 
+        'forget_settings' -- discard the record of the settings that
+            have been sent to gnuplot.
+
+        'get_range' -- return the limits of a range set by
+            'set_range' (or 'set').
+
+        'close' -- stop gnuplot and delete the temporary files in
+            'tempfiles'.  A Gnuplot object can also be used in a
+            'with' statement, which activates 'tempfiles' and closes
+            the object at the end.
+
         '_clear_queue' -- clear the current 'PlotItem' list.
 
         '_add_to_queue' -- add the specified items to the current
             'PlotItem' list.
 
+    The 'set_*' methods (and the methods like 'xlabel' and 'title'
+    that are built on them) remember which settings they have sent to
+    gnuplot, and do not send a setting again if it is already in
+    effect.  The record is discarded whenever something else might
+    have changed gnuplot's settings: by 'reset' and 'load', and when
+    an arbitrary command is sent by calling the object.  If the
+    settings can change in other ways (for example, by zooming with
+    the mouse in the plot window), call 'forget_settings' before
+    re-applying them.
+
+    The ranges set by 'set_range' are also recorded for 'get_range',
+    which items that choose their data according to the visible ranges
+    use.  This record is discarded by 'forget_settings' and by
+    commands that might change a range, but not by other commands.
+
     """
 
     # optiontypes tells how to set parameters.  Specifically, the
@@ -202,6 +308,7 @@ class Gnuplot:
 
         """
 
+        self.tempfiles = tempfiles.TempSession()
         if filename is None:
             self.gnuplot = gp.GnuplotProcess(persist=persist)
         else:
@@ -211,8 +318,17 @@ class Gnuplot:
                     'persist option.')
             self.gnuplot = _GnuplotFile(filename)
         self._clear_queue()
+        self._settings = {}
+        # Map from range option to the value set by 'set_range':
+        self._ranges = {}
+        # Map from name to version of the datablocks defined in gnuplot,
+        # and the names of datablocks that are no longer needed:
+        self._datablocks = {}
+        self._unused_datablocks = []
         self.debug = debug
         self.plotcmd = 'plot'
+        # Let the memory budget know which items are being plotted:
+        budget.memory_budget.add_session(self)
         self('set terminal %s' % (gp.GnuplotOpts.default_term,))
 
     def close(self):
@@ -222,6 +338,14 @@ class Gnuplot:
         if self.gnuplot is not None:
             self.gnuplot.close()
             self.gnuplot = None
+        self.tempfiles.close()
+
+    def __enter__(self):
+        self.tempfiles.activate()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
 
     def __del__(self):
         self.close()
@@ -231,8 +355,24 @@ class Gnuplot:
         """Send a command string to gnuplot.
 
         Send the string s as a command to gnuplot, followed by a
-        newline.  All communication with the gnuplot process (except
-        for inline data) is through this method.
+        newline.  Since the command might change any of gnuplot's
+        settings, the record of settings that have been sent is
+        discarded.
+
+        """
+
+        self._settings.clear()
+        if _changes_ranges(s):
+            self._ranges.clear()
+        if _drops_datablocks(s):
+            self._datablocks.clear()
+        self._send(s)
+
+    def _send(self, s):
+        """Send a command string that doesn't change any settings.
+
+        All communication with the gnuplot process (except for inline
+        data) is through this method.
 
         """
 
@@ -249,15 +389,47 @@ class Gnuplot:
 
         """
 
+        for name in self._unused_datablocks:
+            self._send('undefine %s' % (name,))
+        self._unused_datablocks = []
+        for item in self.itemlist:
+            item.prepare(self)
         plotcmds = []
         for item in self.itemlist:
             plotcmds.append(item.command())
-        self(self.plotcmd + ' ' + ', '.join(plotcmds))
+        self._send(self.plotcmd + ' ' + ', '.join(plotcmds))
         for item in self.itemlist:
             # Uses self.gnuplot.write():
             item.pipein(self.gnuplot)
         self.gnuplot.flush()
 
+    def _define_datablock(self, name, version, content):
+        """Upload 'content' to the datablock 'name' unless it is current.
+
+        'version' identifies the content; the datablock is only
+        (re)defined if gnuplot holds a different version of it.
+        'content' must end with a newline.
+
+        """
+
+        if self._datablocks.get(name) != version:
+            self._send('%s << EOD' % (name,))
+            self.gnuplot.write(content)
+            self._send('EOD')
+            self._datablocks[name] = version
+
+    def _undefine_datablock(self, name):
+        """Free the datablock 'name' the next time the plot is refreshed.
+
+        This is called when the item owning the datablock is deleted,
+        which can happen at an awkward moment (e.g., while a command is
+        being written), so the 'undefine' command is only queued here.
+
+        """
+
+        if self._datablocks.pop(name, None) is not None:
+            self._unused_datablocks.append(name)
+
     def _clear_queue(self):
         """Clear the 'PlotItems' from the queue."""
 
@@ -280,7 +452,11 @@ class Gnuplot:
                 self.itemlist.append(PlotItems.Func(item))
             else:
                 # assume data is an array:
-                self.itemlist.append(PlotItems.Data(item))
+                self.tempfiles.activate()
+                try:
+                    self.itemlist.append(PlotItems.Data(item))
+                finally:
+                    self.tempfiles.deactivate()
 
     def plot(self, *items, **keyw):
         """Draw a new plot.
@@ -387,7 +563,7 @@ class Gnuplot:
     def clear(self):
         """Clear the plot window (without affecting the current itemlist)."""
 
-        self('clear')
+        self._send('clear')
 
     def reset(self):
         """Reset all gnuplot settings to their defaults and clear itemlist."""
@@ -399,19 +575,44 @@ class Gnuplot:
         """Load a file using gnuplot's 'load' command."""
 
         self("load '%s'" % (filename,))
+        self._datablocks.clear()
 
     def save(self, filename):
         """Save the current plot commands using gnuplot's 'save' command."""
 
-        self("save '%s'" % (filename,))
+        self._send("save '%s'" % (filename,))
+
+    def forget_settings(self):
+        """Discard the record of settings that have been sent to gnuplot.
+
+        After this call, each setting is sent again the next time it
+        is set, whether or not it has changed.  The ranges returned by
+        'get_range' are forgotten too.
+
+        """
+
+        self._settings.clear()
+        self._ranges.clear()
+
+    def _set(self, option, value, cmd):
+        """Send the command 'cmd' that sets 'option' to 'value'.
+
+        The command is not sent if the same command was the last one
+        sent for 'option' and nothing has invalidated it since.
+
+        """
+
+        if self._settings.get(option, (None, None))[1] != cmd:
+            self._send(cmd)
+            self._settings[option] = (value, cmd)
 
     def set_string(self, option, s=None):
         """Set a string option, or if s is omitted, unset the option."""
 
         if s is None:
-            self('set %s' % (option,))
+            self._set(option, s, 'set %s' % (option,))
         else:
-            self('set %s "%s"' % (option, s))
+            self._set(option, s, 'set %s "%s"' % (option, s))
 
     def set_label(self, option, s=None, offset=None, font=None):
         """Set or clear a label option, which can include an offset or font.
@@ -436,7 +637,7 @@ class Gnuplot:
             if font is not None:
                 cmd.append('"%s"' % (font,))
 
-        self(' '.join(cmd))
+        self._set(option, s, ' '.join(cmd))
 
     def set_boolean(self, option, value):
         """Set an on/off option.  It is assumed that the way to turn
@@ -444,9 +645,9 @@ class Gnuplot:
         `set no<option>'."""
 
         if value:
-            self('set %s' % option)
+            self._set(option, value, 'set %s' % option)
         else:
-            self('set no%s' % option)
+            self._set(option, value, 'set no%s' % option)
 
     def set_range(self, option, value):
         """Set a range option (xrange, yrange, trange, urange, etc.).
@@ -456,10 +657,11 @@ class Gnuplot:
         then that range is passed as `*' (which means to
         autoscale)."""
 
+        self._ranges[option] = value
         if value is None:
-            self('set %s [*:*]' % (option,))
+            self._set(option, value, 'set %s [*:*]' % (option,))
         elif isinstance(value, str):
-            self('set %s %s' % (option, value,))
+            self._set(option, value, 'set %s %s' % (option, value,))
         else:
             # Must be a tuple:
             (minrange,maxrange) = value
@@ -467,7 +669,44 @@ class Gnuplot:
                 minrange = '*'
             if maxrange is None:
                 maxrange = '*'
-            self('set %s [%s:%s]' % (option, minrange, maxrange,))
+            self._set(
+                option, value,
+                'set %s [%s:%s]' % (option, minrange, maxrange,),
+                )
+
+    def get_range(self, option):
+        """Return the limits of a range set by 'set_range'.
+
+        Return a tuple '(min, max)' describing the range most recently
+        set for 'option' (e.g., 'xrange').  Either limit is None if it
+        is autoscaled or is not a plain number.  Return None if the
+        range is not known, i.e., if it hasn't been set since a command
+        that might change it was sent (see '_changes_ranges') or
+        'forget_settings' was called.
+
+        """
+
+        try:
+            value = self._ranges[option]
+        except KeyError:
+            return None
+        if value is None:
+            return (None, None)
+        if isinstance(value, str):
+            # e.g., '[0:10]' or '[-pi:pi] reverse':
+            value = value.strip()
+            if not value.startswith('['):
+                return (None, None)
+            value = value[1:].split(']')[0].split(':')
+            if len(value) != 2:
+                return (None, None)
+        limits = []
+        for limit in value:
+            try:
+                limits.append(float(limit))
+            except (TypeError, ValueError):
+                limits.append(None)
+        return tuple(limits)
 
     def set(self, **keyw):
         """Set one or more settings at once from keyword arguments.
@@ -532,7 +771,10 @@ class Gnuplot:
                     tic = Tic(*tic)
                 tics_strings.append(str(tic))
             tics_string = '(%s)' % (', '.join(tics_strings),)
-        self('set %stics %s' % (axis, tics_string,))
+        self._set(
+            '%stics' % (axis,), value,
+            'set %stics %s' % (axis, tics_string,),
+            )
 
     def hardcopy(self, filename=None, terminal='postscript', **keyw):
         """Create a hardcopy of the current plot.
@@ -637,11 +879,11 @@ class Gnuplot:
                 )
 
         self.set_string('output', filename)
-        self(' '.join(setterm))
+        self._send(' '.join(setterm))
         # replot the current figure (to the printer):
         self.refresh()
         # reset the terminal to its `default' setting:
-        self('set terminal %s' % gp.GnuplotOpts.default_term)
+        self._send('set terminal %s' % gp.GnuplotOpts.default_term)
         self.set_string('output')
 
 
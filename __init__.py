@@ -95,6 +95,10 @@ Features:
     * 'GridData(m, x, y)' -- data tabulated on a grid of (x,y) values
                              (usually to be plotted in 3-D)
 
+    * 'StreamData(buffer)' -- the current contents of a 'RingBuffer'
+                              that is being filled while it is
+                              plotted (see streaming.py)
+
     See the documentation strings for those classes for more details.
 
  o  PlotItems are implemented as objects that can be assigned to
@@ -161,8 +165,14 @@ __version__ = '1.8+'
 __all__ = ['utils', 'funcutils', ]
 
 from gp import GnuplotOpts, GnuplotProcess, test_persist
-from Errors import Error, OptionError, DataError
-from PlotItems import PlotItem, Func, File, Data, GridData
+from Errors import Error, OptionError, DataError, BudgetError
+from PlotItems import (
+    PlotItem, Func, File, Data, GridData, GridPyramid, ZoomData, Histogram,
+    Density2D,
+    )
 from _Gnuplot import Gnuplot, Tic
+from streaming import RingBuffer, StreamData, LiveRefresher
+from budget import MemoryBudget, memory_budget
+from tempfiles import TempSession
 
 
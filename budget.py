@@ -0,0 +1,234 @@
+# $Id$
+
+# This file is licensed under the GNU Lesser General Public License
+# (LGPL).  See LICENSE.txt for details.
+
+"""budget.py -- Account for the memory used by the data of PlotItems.
+
+Each PlotItem that keeps serialized data in memory (inline, FIFO, and
+datablock items) registers the size of its data with the process-wide
+'MemoryBudget' instance 'memory_budget', so that the total memory used
+by all live items can be inspected::
+
+    print(Gnuplot.memory_budget.total, Gnuplot.memory_budget.high_water)
+    for (item, size) in Gnuplot.memory_budget.sizes():
+        print(item, size)
+
+If 'gp.GnuplotOpts.memory_limit' is set to a number of bytes, the
+budget is enforced each time an item registers more data.  The
+actions listed in 'gp.GnuplotOpts.memory_policy' are then tried in
+order until the total is within the limit:
+
+    'drop' -- discard the data cached by items that choose what to send
+        each time they are plotted ('cull=1' data, 'GridPyramid',
+        'ZoomData'), unless they are in the current plot of a
+        'Gnuplot' object.  The data are computed again when the item
+        is next plotted.
+
+    'spill' -- move the data of inline and FIFO items to files (see
+        the 'spill' option of 'Data'), largest first.
+
+    'raise' -- raise 'BudgetError'.  The item whose data exceeded the
+        budget is not created.
+
+If the total is still over the limit after all of the actions, the
+data are kept anyway.
+
+"""
+
+import threading, weakref
+
+import gp, Errors
+
+
+class MemoryBudget:
+    """Keeps track of the memory used by the data of all PlotItems.
+
+    Members:
+
+        'total' -- the number of bytes currently registered.
+
+        'high_water' -- the largest value that 'total' has had since
+            the budget was created or 'reset_high_water' was called.
+
+    Items call 'register' when they store data and 'Gnuplot' objects
+    call 'add_session' so that the items they are plotting can be
+    recognized.  An item that has another item send its data calls
+    'adopt', so that the data are accounted for as its own.  An item
+    can offer two ways of reducing its memory use, which are tried by
+    'enforce':
+
+        '_drop_content()' -- discard data that can be recomputed.
+
+        '_spill_content()' -- move data from memory to a file.
+
+    Items are referred to weakly, so they are forgotten automatically
+    when they are deleted.
+
+    """
+
+    def __init__(self):
+        self.total = 0
+        self.high_water = 0
+        self._sizes = {}
+        self._owners = weakref.WeakKeyDictionary()
+        self._sessions = weakref.WeakKeyDictionary()
+        self._lock = threading.RLock()
+
+    def register(self, item, size):
+        """Record that 'item' holds 'size' bytes of data.
+
+        This replaces any size registered earlier for 'item'.  If the
+        size has grown, the budget is enforced; if 'BudgetError' is
+        raised, the size registered earlier is kept.  The size of an
+        item that has been adopted is registered for its owner.
+
+        """
+
+        with self._lock:
+            owner = self._owners.get(item)
+            if owner is not None and owner() is not None:
+                item = owner()
+            key = id(item)
+            if key in self._sizes:
+                (ref, old) = self._sizes[key]
+            else:
+                ref = weakref.ref(item, lambda ref, key=key: self._forget(key))
+                old = 0
+            self._sizes[key] = (ref, size)
+            self.total += size - old
+            self.high_water = max(self.high_water, self.total)
+        if size > old:
+            try:
+                self.enforce(item)
+            except Errors.BudgetError:
+                if old:
+                    # The item keeps the data it had before:
+                    with self._lock:
+                        self._forget(key)
+                        self._sizes[key] = (ref, old)
+                        self.total += old
+                raise
+
+    def adopt(self, owner, item):
+        """Account for the data of 'item' as part of those of 'owner'.
+
+        The size registered for 'item', now and later, is registered
+        for 'owner' instead (replacing what 'owner' registered before),
+        so 'owner' is the one asked to drop or spill the data.
+
+        """
+
+        size = self.size(item)
+        self.release(item)
+        with self._lock:
+            self._owners[item] = weakref.ref(owner)
+        self.register(owner, size)
+
+    def release(self, item):
+        """Forget about the data of 'item'."""
+
+        self._forget(id(item))
+
+    def _forget(self, key):
+        with self._lock:
+            if key in self._sizes:
+                (ref, size) = self._sizes.pop(key)
+                self.total -= size
+
+    def size(self, item):
+        """Return the number of bytes registered for 'item'."""
+
+        with self._lock:
+            return self._sizes.get(id(item), (None, 0))[1]
+
+    def _entries(self):
+        """Return a list of '(ref, size)' pairs, largest first."""
+
+        with self._lock:
+            entries = list(self._sizes.values())
+        entries.sort(key=lambda entry: -entry[1])
+        return entries
+
+    def sizes(self):
+        """Return a list of '(item, size)' pairs, largest first."""
+
+        result = []
+        for (ref, size) in self._entries():
+            item = ref()
+            if item is not None:
+                result.append((item, size))
+        return result
+
+    def reset_high_water(self):
+        """Set 'high_water' to the current total."""
+
+        with self._lock:
+            self.high_water = self.total
+
+    def add_session(self, gnuplot):
+        """Treat the items in 'gnuplot.itemlist' as being plotted."""
+
+        self._sessions[gnuplot] = 1
+
+    def _plotted(self):
+        """Return the ids of the items that are being plotted."""
+
+        plotted = set()
+        for gnuplot in list(self._sessions.keys()):
+            for item in gnuplot.itemlist:
+                plotted.add(id(item))
+        return plotted
+
+    def enforce(self, item=None):
+        """Apply 'gp.GnuplotOpts.memory_policy' if over the limit.
+
+        'item' is the item that has just registered its data, if any.
+        Its data are not dropped (though they may be spilled), and it
+        is released before 'BudgetError' is raised.
+
+        """
+
+        limit = gp.GnuplotOpts.memory_limit
+        if limit is None or self.total <= limit:
+            return
+        for action in gp.GnuplotOpts.memory_policy:
+            if action == 'drop':
+                plotted = self._plotted()
+                for (ref, size) in self._entries():
+                    if self.total <= limit:
+                        return
+                    other = ref()
+                    if (other is not None and other is not item
+                        and id(other) not in plotted
+                        and hasattr(other, '_drop_content')):
+                        other._drop_content()
+                    # Let go of the item so that the data it dropped
+                    # can be freed right away:
+                    other = None
+            elif action == 'spill':
+                for (ref, size) in self._entries():
+                    if self.total <= limit:
+                        return
+                    other = ref()
+                    if (other is not None and size > 0
+                        and hasattr(other, '_spill_content')):
+                        other._spill_content()
+                    other = None
+            elif action == 'raise':
+                if self.total > limit:
+                    total = self.total
+                    if item is not None:
+                        self.release(item)
+                    raise Errors.BudgetError(
+                        'plot data would take %d bytes, more than the '
+                        'memory limit of %d bytes' % (total, limit,)
+                        )
+            else:
+                raise Errors.OptionError('memory_policy=%s' % (action,))
+            if self.total <= limit:
+                return
+
+
+# The budget shared by all PlotItems:
+memory_budget = MemoryBudget()
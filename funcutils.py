@@ -12,12 +12,497 @@ points and tabulate the output to be used with Gnuplot.
 
 """
 
+import os, hashlib, tempfile, threading, multiprocessing, traceback
+
 import numpy
 
-import Gnuplot, utils
+import Gnuplot, gp, utils, PlotItems
+
+
+def _probe_points(n):
+    """Return a few indices spread over 'range(n)' for spot checks."""
+
+    return sorted(set([0, n // 3, n // 2, (2 * n) // 3, n - 1]))
+
+
+def _vectorizes(f, xvals, yvals):
+    """Return the result of calling 'f' on whole arrays, or None.
+
+    'f' is called with 'xvals' (and 'yvals') arranged as for
+    'ufunc=1'.  If that raises an exception, returns something of the
+    wrong shape, or returns values that differ from those of calling
+    'f' on individual points, return None.
+
+    """
+
+    old_settings = numpy.seterr(all='ignore')
+    try:
+        try:
+            if yvals is None:
+                m = numpy.asarray(f(xvals))
+                shape = xvals.shape
+            else:
+                m = numpy.asarray(
+                    f(xvals[:,numpy.newaxis], yvals[numpy.newaxis,:])
+                    )
+                shape = (len(xvals), len(yvals))
+            if m.shape != shape or m.dtype == object:
+                return None
+            for i in _probe_points(len(xvals)):
+                if yvals is None:
+                    points = [((i,), f(xvals[i]))]
+                else:
+                    points = [
+                        ((i, j), f(xvals[i], yvals[j]))
+                        for j in _probe_points(len(yvals))
+                        ]
+                for (index, value) in points:
+                    if not numpy.allclose(
+                        m[index], value, rtol=1.0e-7, atol=0.0,
+                        equal_nan=True
+                        ):
+                        return None
+        except Exception:
+            return None
+    finally:
+        numpy.seterr(**old_settings)
+    return m
+
+
+# The state of a worker process of a '_TabulationPool':
+_worker = {}
+
+
+def _init_worker(f, xbuffer, ybuffer, mbuffer):
+    _worker['f'] = f
+    _worker['buffers'] = (xbuffer, ybuffer, mbuffer)
+
+
+def _tabulate_rows(task):
+    """Tabulate rows 'start:stop' of the output of a worker process.
+
+    'task' is a tuple '(start, stop, xdtype, numx, ydtype, numy,
+    dtype)' describing the points and the result in the shared
+    buffers.  'ydtype' is None for a function of one variable.
+
+    Return None, or if 'f' raises an exception, a tuple '(point,
+    traceback)' describing the point at which it happened.
+
+    """
+
+    (start, stop, xdtype, numx, ydtype, numy, dtype) = task
+    f = _worker['f']
+    (xbuffer, ybuffer, mbuffer) = _worker['buffers']
+    xvals = numpy.frombuffer(xbuffer, xdtype, numx)
+    if ydtype is None:
+        yvals = None
+        m = numpy.frombuffer(mbuffer, dtype, numx)
+    else:
+        yvals = numpy.frombuffer(ybuffer, ydtype, numy)
+        m = numpy.frombuffer(mbuffer, dtype, numx * numy)
+        m = m.reshape((numx, numy))
+    for xi in range(start, stop):
+        x = xvals[xi]
+        try:
+            if yvals is None:
+                m[xi] = f(x)
+            else:
+                for yi in range(len(yvals)):
+                    y = yvals[yi]
+                    m[xi,yi] = f(x,y)
+        except Exception:
+            if yvals is None:
+                point = (x,)
+            else:
+                point = (x, y)
+            return (point, traceback.format_exc())
+    return None
+
+
+class _TabulationPool:
+    """A pool of 'workers' processes that evaluate 'f' point by point.
+
+    The points and the results are passed through buffers in shared
+    memory.  The processes are started by the first call of
+    'tabulate' and are reused by later calls (e.g., for each block of
+    a streamed grid) until 'close' is called; they are only started
+    again if the buffers have to grow.
+
+    """
+
+    def __init__(self, f, workers):
+        self.f = f
+        self.workers = workers
+        self._pool = None
+        self._buffers = None
+        method = gp.GnuplotOpts.worker_start_method
+        if method is None:
+            self._context = multiprocessing
+        else:
+            try:
+                self._context = multiprocessing.get_context(method)
+            except AttributeError:
+                # (Older Pythons only have the default method.)
+                self._context = multiprocessing
+            except ValueError:
+                raise Gnuplot.OptionError(
+                    'worker_start_method=%s' % (method,))
+
+    def _start(self, sizes):
+        if self._buffers is not None:
+            sizes = [
+                max(size, len(buffer))
+                for (size, buffer) in zip(sizes, self._buffers)
+                ]
+        self.close()
+        self._buffers = [
+            self._context.RawArray('b', max(size, 1)) for size in sizes
+            ]
+        self._pool = self._context.Pool(
+            self.workers, _init_worker, (self.f,) + tuple(self._buffers)
+            )
+
+    def tabulate(self, xvals, yvals, dtype):
+        """Return the values of 'f' for 'xvals' (and 'yvals').
+
+        The rows of the output (values of x) are divided into blocks,
+        which are evaluated by the worker processes.  The result is
+        an array in shared memory, which is only valid until the next
+        call.
+
+        """
+
+        dtype = numpy.dtype(dtype)
+        if yvals is None:
+            shape = (len(xvals),)
+            (ydtype, ysize) = (None, 0)
+        else:
+            shape = (len(xvals), len(yvals))
+            (ydtype, ysize) = (yvals.dtype.str, yvals.nbytes)
+        sizes = [xvals.nbytes, ysize, int(numpy.prod(shape)) * dtype.itemsize]
+        if self._pool is None or [
+            size for (size, buffer) in zip(sizes, self._buffers)
+            if size > len(buffer)
+            ]:
+            self._start(sizes)
+        (xbuffer, ybuffer, mbuffer) = self._buffers
+        numpy.frombuffer(xbuffer, xvals.dtype, len(xvals))[:] = xvals
+        if yvals is not None:
+            numpy.frombuffer(ybuffer, yvals.dtype, len(yvals))[:] = yvals
+        m = numpy.frombuffer(mbuffer, dtype, int(numpy.prod(shape)))
+        m = m.reshape(shape)
+
+        # Use several blocks per worker so that the load is balanced:
+        blocksize = max(1, -(-len(xvals) // (4 * self.workers)))
+        tasks = [
+            (start, min(start + blocksize, len(xvals)),
+             xvals.dtype.str, len(xvals), ydtype, shape[-1], dtype.str)
+            for start in range(0, len(xvals), blocksize)
+            ]
+
+        try:
+            for error in self._pool.imap_unordered(_tabulate_rows, tasks):
+                if error is not None:
+                    (point, tb) = error
+                    if len(point) == 1:
+                        where = 'x=%s' % point
+                    else:
+                        where = 'x=%s, y=%s' % point
+                    raise Gnuplot.DataError(
+                        'error evaluating function at %s:\n%s' % (where, tb,)
+                        )
+        except:
+            # Don't let the remaining tasks write into the buffers:
+            self.close()
+            raise
+        return m
+
+    def close(self):
+        """Stop the worker processes."""
+
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+
+def _tabulate_points(f, xvals, yvals, dtype, ufunc, pool):
+    """Tabulate 'f' for 'ufunc=0' or 'ufunc="auto"' using 'pool'.
+
+    'pool' is a '_TabulationPool', which is only used if 'f' has to
+    be evaluated point by point.  Return a tuple '(m, strategy)' (see
+    'tabulate_function').
+
+    """
+
+    xvals = numpy.asarray(xvals, dtype)
+    if yvals is not None:
+        yvals = numpy.asarray(yvals, dtype)
+    m = None
+    if ufunc == 'auto':
+        m = _vectorizes(f, xvals, yvals)
+    if m is not None:
+        return (m, 'ufunc')
+    if dtype is None:
+        if yvals is None:
+            dtype = xvals.dtype
+        else:
+            dtype = numpy.result_type(xvals, yvals)
+    return (pool.tabulate(xvals, yvals, dtype), 'processes')
+
+
+def _tabulate_tiled(f, xvals, yvals, tile, threads):
+    """Evaluate the ufunc-style function 'f' one tile at a time.
+
+    The result array is allocated once, and 'f' is called for each
+    tile of at most 'tile' points (a tuple '(numx, numy)' for functions
+    of two variables) with the corresponding parts of 'xvals' and
+    'yvals', so the temporary arrays created while evaluating 'f' are
+    no larger than a tile.  If 'threads' is greater than 1, the tiles
+    are evaluated by that many threads.
+
+    """
+
+    if yvals is None:
+        tiles = [
+            (slice(start, start + tile),)
+            for start in range(0, len(xvals), tile)
+            ]
+        shape = xvals.shape
+    else:
+        (tx, ty) = tile
+        tiles = [
+            (slice(i, i + tx), slice(j, j + ty))
+            for i in range(0, len(xvals), tx)
+            for j in range(0, len(yvals), ty)
+            ]
+        shape = (len(xvals), len(yvals))
+    if not tiles:
+        # The grid is empty; 'f' is still called (with empty arrays)
+        # to find the type of the result:
+        tiles = [(slice(None),) * len(shape)]
+
+    def evaluate(index):
+        if yvals is None:
+            return f(xvals[index[0]])
+        else:
+            return f(
+                xvals[index[0],numpy.newaxis], yvals[numpy.newaxis,index[1]]
+                )
+
+    # The type of the result is that of all of the tiles together (as
+    # given by numpy.result_type); the result array is converted if a
+    # tile needs a wider type than the tiles before it:
+    first = numpy.asarray(evaluate(tiles[0]))
+    result = [numpy.empty(shape, first.dtype)]
+    result[0][tiles[0]] = first
+
+    remaining = iter(tiles[1:])
+    lock = threading.Lock()
+    errors = []
+
+    def work():
+        while not errors:
+            lock.acquire()
+            try:
+                index = next(remaining, None)
+            finally:
+                lock.release()
+            if index is None:
+                return
+            try:
+                value = numpy.asarray(evaluate(index))
+            except Exception as e:
+                errors.append(e)
+                return
+            lock.acquire()
+            try:
+                m = result[0]
+                dtype = numpy.result_type(m.dtype, value.dtype)
+                if dtype != m.dtype:
+                    m = result[0] = m.astype(dtype)
+                m[index] = value
+            finally:
+                lock.release()
+
+    if threads is not None and threads > 1:
+        pool = [threading.Thread(target=work) for i in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+    else:
+        work()
+    if errors:
+        raise errors[0]
+    return result[0]
+
+
+def _check_tiling(ufunc, tile, threads):
+    """Raise 'OptionError' if 'tile' or 'threads' can't be used."""
+
+    if (tile or (threads is not None and threads > 1)) and not ufunc:
+        raise Gnuplot.OptionError(
+            'tile and threads require ufunc=1 or ufunc="auto"')
+
+
+def _tile_shape(tile, threads, yvals):
+    """Return the size of the tiles for the 'tile' and 'threads' options.
+
+    The result is an int for a function of one variable, or a tuple
+    '(numx, numy)' for a function of two variables ('yvals' not None),
+    or None if the function should not be evaluated in tiles.  If
+    'threads' is given without 'tile', a default tile is used.
+
+    """
+
+    if not tile:
+        if threads is None or threads <= 1:
+            return None
+        if yvals is None:
+            tile = 65536
+        else:
+            tile = 256
+    if yvals is None:
+        return int(tile)
+    elif isinstance(tile, tuple):
+        return (int(tile[0]), int(tile[1]))
+    else:
+        return (int(tile), int(tile))
+
+
+def _tile_vectorizes(f, xvals, yvals, tile):
+    """Return true if 'f' works on arrays, judging by one tile."""
+
+    if yvals is None:
+        return _vectorizes(f, xvals[:tile], None) is not None
+    else:
+        return _vectorizes(f, xvals[:tile[0]], yvals[:tile[1]]) is not None
+
+
+class TabulationCache:
+    """An on-disk cache of tabulated function values.
+
+    A 'TabulationCache' can be passed to 'tabulate_function' (or
+    'compute_Data' or 'compute_GridData') together with a 'cache_key'
+    identifying the function, to avoid evaluating a deterministic
+    function again for the same points, even in another session.  Each
+    result is stored as a '.npy' file in 'directory', named after a
+    hash of the 'cache_key' and of the points, type, and 'ufunc'
+    option requested.
+    When the files take more than 'max_bytes' in total, the least
+    recently used ones are deleted.
+
+    It is up to the caller to change the 'cache_key' (e.g., by
+    including a version number) whenever the function changes.
 
+    Members:
 
-def tabulate_function(f, xvals, yvals=None, dtype=None, ufunc=0):
+        'directory' -- the directory holding the cached results.
+
+        'max_bytes' -- the maximum total size of the cached results.
+
+        'hits', 'misses' -- the number of lookups that did and did not
+            find a cached result.
+
+    """
+
+    def __init__(self, directory, max_bytes=2**30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def key(self, cache_key, xvals, yvals=None, dtype=None, ufunc=0):
+        """Return the name under which a tabulation is cached."""
+
+        h = hashlib.sha1(repr(cache_key).encode('utf-8'))
+        # The way 'f' is called can change its results (e.g., their
+        # type):
+        if ufunc != 'auto':
+            ufunc = bool(ufunc)
+        h.update(repr(ufunc).encode('ascii'))
+        for vals in [xvals, yvals]:
+            if vals is None:
+                h.update(b'None')
+            else:
+                vals = numpy.ascontiguousarray(vals)
+                h.update(repr((vals.dtype.str, vals.shape)).encode('ascii'))
+                h.update(vals.tobytes())
+        h.update(repr(dtype and numpy.dtype(dtype).str).encode('ascii'))
+        return h.hexdigest()
+
+    def _filename(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    def get(self, key):
+        """Return the cached result for 'key', or None."""
+
+        filename = self._filename(key)
+        try:
+            m = numpy.load(filename)
+            # Record the use for the LRU policy:
+            os.utime(filename, None)
+        except (IOError, OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return m
+
+    def put(self, key, m):
+        """Store 'm' as the result for 'key', evicting old results."""
+
+        m = numpy.asarray(m)
+        if m.nbytes > self.max_bytes or m.dtype == object:
+            return
+        (fd, tmpname) = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        f = os.fdopen(fd, 'wb')
+        try:
+            numpy.save(f, m)
+        finally:
+            f.close()
+        if hasattr(os, 'replace'):
+            os.replace(tmpname, self._filename(key))
+        else:
+            os.rename(tmpname, self._filename(key))
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used results beyond 'max_bytes'."""
+
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                filename = os.path.join(self.directory, name)
+                try:
+                    st = os.stat(filename)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, filename))
+        entries.sort()
+        total = sum([entry[1] for entry in entries])
+        for (mtime, size, filename) in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(filename)
+            except OSError:
+                pass
+            total -= size
+
+    def clear(self):
+        """Delete all cached results."""
+
+        for name in os.listdir(self.directory):
+            if name.endswith('.npy'):
+                os.unlink(os.path.join(self.directory, name))
+
+
+def tabulate_function(f, xvals, yvals=None, dtype=None, ufunc=0,
+                      return_strategy=0, workers=None,
+                      cache=None, cache_key=None, tile=None, threads=None):
     """Evaluate and tabulate a function on a 1- or 2-D grid of points.
 
     f should be a function taking one or two floating-point
@@ -43,13 +528,137 @@ def tabulate_function(f, xvals, yvals=None, dtype=None, ufunc=0):
     element-by-element on whole matrices).  It will be passed the
     xvals and yvals as rectangular matrices.
 
+    If called with 'ufunc=1' and 'tile', 'f' is instead called for one
+    tile of the grid at a time, and the values are stored in a result
+    array allocated in advance.  'tile' is the maximum number of x
+    values per tile for functions of one variable, or a tuple '(numx,
+    numy)' (or a single number used for both) for functions of two
+    variables.  This keeps the temporary arrays created while
+    evaluating 'f' small enough to fit into the processor's cache (a
+    tile of about 256x256 points is usually a good choice).  If
+    'threads' is greater than 1, the tiles are evaluated by that many
+    threads at once (numpy releases the interpreter lock while a
+    ufunc works on a large array); if 'tile' is not given, tiles of
+    65536 points (256x256 for two variables) are used.  With
+    'ufunc="auto"', 'tile' and 'threads' are used if 'f' works on the
+    arrays of the first tile (regardless of 'workers').  They cannot
+    be combined with 'ufunc=0'.
+
+    If called with 'ufunc="auto"', then 'f' is first called as for
+    'ufunc=1'.  If that fails, or if the result has the wrong shape,
+    or if its values at a few sample points differ from those returned
+    by calling 'f' on the individual points, then 'f' is instead
+    evaluated at each point using 'numpy.frompyfunc', a row at a time
+    (which is still much faster than the loop used for 'ufunc=0').
+
+    If 'return_strategy' is true, a tuple '(m, strategy)' is returned,
+    where 'strategy' is 'ufunc', 'tiles', 'frompyfunc', 'loop', or
+    'processes' according to how 'f' was evaluated.
+
+    If 'workers' is greater than 1 and 'f' is to be evaluated point
+    by point (i.e., 'ufunc=0', or 'ufunc="auto"' and 'f' is found not
+    to work on arrays), the rows of the result are divided among a
+    pool of 'workers' processes, which store the values directly in
+    a result array in shared memory.  Unless
+    'gp.GnuplotOpts.worker_start_method' is 'fork', 'f' must then be
+    picklable, e.g., a module-level function.  If
+    'f' raises an exception, a 'DataError' is raised that gives the
+    point at which it happened and the original traceback.
+
+    If 'cache' is a 'TabulationCache', 'cache_key' must be specified
+    too, and the result is looked up in the cache under 'cache_key',
+    'xvals', 'yvals', 'dtype', and 'ufunc' before evaluating 'f' (in
+    which case the strategy is reported as 'cache').  'cache_key' must
+    identify the function (and its version); it can be any object with
+    a stable 'repr', e.g. a string or a tuple.
+
     """
 
+    _check_tiling(ufunc, tile, threads)
+
+    if cache is not None:
+        if cache_key is None:
+            raise Gnuplot.OptionError('cache requires a cache_key')
+        key = cache.key(cache_key, xvals, yvals, dtype, ufunc)
+        m = cache.get(key)
+        if m is not None:
+            strategy = 'cache'
+        else:
+            (m, strategy) = tabulate_function(
+                f, xvals, yvals, dtype, ufunc, 1, workers,
+                tile=tile, threads=threads,
+                )
+            cache.put(key, m)
+        if return_strategy:
+            return (m, strategy)
+        else:
+            return m
+
+    if tile or (threads is not None and threads > 1):
+        xvals = numpy.asarray(xvals, dtype)
+        if yvals is not None:
+            yvals = numpy.asarray(yvals, dtype)
+        tile = _tile_shape(tile, threads, yvals)
+        if ufunc == 'auto' and _tile_vectorizes(f, xvals, yvals, tile):
+            ufunc = 1
+    else:
+        tile = None
+
+    if workers is not None and workers > 1 and ufunc != 1:
+        pool = _TabulationPool(f, workers)
+        try:
+            (m, strategy) = _tabulate_points(
+                f, xvals, yvals, dtype, ufunc, pool
+                )
+        finally:
+            pool.close()
+        if return_strategy:
+            return (m, strategy)
+        else:
+            return m
+
+    if ufunc == 'auto':
+        xvals = numpy.asarray(xvals, dtype)
+        if yvals is not None:
+            yvals = numpy.asarray(yvals, dtype)
+        m = _vectorizes(f, xvals, yvals)
+        if m is not None:
+            strategy = 'ufunc'
+        else:
+            strategy = 'frompyfunc'
+            if yvals is None:
+                m = numpy.frompyfunc(f, 1, 1)(xvals).astype(
+                    dtype or xvals.dtype.char
+                    )
+            else:
+                if dtype is None:
+                    dtype = numpy.result_type(xvals, yvals)
+                m = numpy.zeros((len(xvals), len(yvals)), dtype)
+                g = numpy.frompyfunc(f, 2, 1)
+                for xi in range(len(xvals)):
+                    m[xi,:] = g(xvals[xi], yvals)
+        if return_strategy:
+            return (m, strategy)
+        else:
+            return m
+    elif return_strategy:
+        m = tabulate_function(
+            f, xvals, yvals, dtype, ufunc, tile=tile, threads=threads
+            )
+        if ufunc and tile:
+            return (m, 'tiles')
+        elif ufunc:
+            return (m, 'ufunc')
+        else:
+            return (m, 'loop')
+
     if yvals is None:
         # f is a function of only one variable:
         xvals = numpy.asarray(xvals, dtype)
 
-        if ufunc:
+        if ufunc and tile:
+            return _tabulate_tiled(f, xvals, None, tile, threads)
+        elif ufunc:
             return f(xvals)
         else:
             if dtype is None:
@@ -65,7 +674,9 @@ def tabulate_function(f, xvals, yvals=None, dtype=None, ufunc=0):
         xvals = numpy.asarray(xvals, dtype)
         yvals = numpy.asarray(yvals, dtype)
 
-        if ufunc:
+        if ufunc and tile:
+            return _tabulate_tiled(f, xvals, yvals, tile, threads)
+        elif ufunc:
             return f(xvals[:,numpy.newaxis], yvals[numpy.newaxis,:])
         else:
             if dtype is None:
@@ -87,7 +698,119 @@ def tabulate_function(f, xvals, yvals=None, dtype=None, ufunc=0):
 grid_function = tabulate_function
 
 
-def compute_Data(xvals, f, ufunc=0, **keyw):
+def tabulate_adaptive(f, xvals, tolerance=None, max_evals=10000,
+                      max_depth=16, ufunc=0, tile=None, threads=None,
+                      cache=None, cache_key=None):
+    """Tabulate a function of one variable, refining where it bends.
+
+    'f' is first evaluated at each of the points in 'xvals', which
+    should be in increasing order.  Then the midpoint of each interval
+    between adjacent points is evaluated, and wherever the value there
+    differs from the straight line between the ends of the interval by
+    more than 'tolerance', both halves of the interval are refined in
+    the same way.  Thus flat and straight parts of the function are
+    sampled sparsely, and sharp features densely.
+
+    The midpoints needed at each level of refinement are evaluated
+    together, using 'tabulate_function' with the given 'ufunc',
+    'tile', and 'threads' options, so a ufunc is called once per
+    level (or once per tile).
+
+    Keyword arguments:
+
+        'tolerance=<float>' -- the largest deviation from linear
+            interpolation that is accepted without refinement.  The
+            default is 1/1000 of the range of the values of 'f' at
+            'xvals'.
+
+        'max_evals=<int>' -- the maximum number of evaluations of 'f'
+            made after the initial ones.  If a level would exceed it,
+            only the intervals with the largest deviations at the
+            previous level are refined.
+
+        'max_depth=<int>' -- the maximum number of times an interval
+            of 'xvals' is halved.
+
+        'cache=<TabulationCache>', 'cache_key=<object>' -- look up
+            the result in a cache (see 'tabulate_function') under
+            'cache_key', 'xvals', 'ufunc', and the options above.
+
+    The return value is a tuple '(x, y)' of 1-D arrays, sorted by x,
+    which can be passed to 'Data'.
+
+    """
+
+    xvals = utils.float_array(xvals)
+    if cache is not None:
+        if cache_key is None:
+            raise Gnuplot.OptionError('cache requires a cache_key')
+        key = cache.key(
+            ('adaptive', cache_key, tolerance, max_evals, max_depth),
+            xvals, ufunc=ufunc,
+            )
+        m = cache.get(key)
+        if m is None:
+            m = numpy.array(tabulate_adaptive(
+                f, xvals, tolerance, max_evals, max_depth, ufunc,
+                tile, threads,
+                ))
+            cache.put(key, m)
+        return (m[0], m[1])
+    yvals = utils.float_array(tabulate_function(
+        f, xvals, ufunc=ufunc, tile=tile, threads=threads
+        ))
+    if xvals.shape != yvals.shape or len(xvals.shape) != 1:
+        raise Gnuplot.DataError('f must return one value per point')
+
+    if tolerance is None:
+        finite = yvals[numpy.isfinite(yvals)]
+        if len(finite):
+            tolerance = 1.0e-3 * (finite.max() - finite.min())
+        if not tolerance:
+            tolerance = 1.0e-3
+
+    xs = [xvals]
+    ys = [yvals]
+
+    # The intervals still to be refined and how badly the previous
+    # level approximated them:
+    (xl, yl, xr, yr) = (xvals[:-1], yvals[:-1], xvals[1:], yvals[1:])
+    priority = numpy.zeros(len(xl))
+    for depth in range(max_depth):
+        if not len(xl) or max_evals <= 0:
+            break
+        if len(xl) > max_evals:
+            keep = numpy.argsort(-priority, kind='mergesort')[:max_evals]
+            keep.sort()
+            (xl, yl, xr, yr) = (xl[keep], yl[keep], xr[keep], yr[keep])
+
+        xm = 0.5 * (xl + xr)
+        ym = utils.float_array(tabulate_function(
+            f, xm, ufunc=ufunc, tile=tile, threads=threads
+            ))
+        max_evals -= len(xm)
+        xs.append(xm)
+        ys.append(ym)
+
+        error = numpy.abs(ym - 0.5 * (yl + yr))
+        refine = error > tolerance
+        priority = numpy.concatenate((error[refine], error[refine]))
+        (xl, yl, xr, yr) = (
+            numpy.concatenate((xl[refine], xm[refine])),
+            numpy.concatenate((yl[refine], ym[refine])),
+            numpy.concatenate((xm[refine], xr[refine])),
+            numpy.concatenate((ym[refine], yr[refine])),
+            )
+
+    x = numpy.concatenate(xs)
+    y = numpy.concatenate(ys)
+    order = numpy.argsort(x, kind='mergesort')
+    return (x[order], y[order])
+
+
+def compute_Data(xvals, f, ufunc=0, adaptive=0, workers=None,
+                 cache=None, cache_key=None, tile=None, threads=None,
+                 **keyw):
     """Evaluate a function of 1 variable and store the results in a Data.
 
     Computes a function f of one variable on a set of specified points
@@ -104,7 +827,25 @@ def compute_Data(xvals, f, ufunc=0, **keyw):
         'f' -- the function to plot--a callable object for which
             f(x) returns a number.
 
-        'ufunc=<bool>' -- evaluate 'f' as a ufunc?
+        'ufunc=<bool>' -- evaluate 'f' as a ufunc?  (Or "auto"; see
+            'tabulate_function'.)
+
+        'adaptive=<bool>' -- use 'tabulate_adaptive' to evaluate 'f'
+            at additional points where it is not well approximated
+            by straight lines between the points in 'xvals'.  The
+            keyword arguments 'tolerance', 'max_evals', and
+            'max_depth' are passed to 'tabulate_adaptive'.
+
+        'workers=<int>' -- evaluate 'f' using this many processes
+            (see 'tabulate_function').
+
+        'cache=<TabulationCache>', 'cache_key=<object>' -- look up
+            the values of 'f' (or with 'adaptive', the points chosen
+            and their values) in a cache (see 'tabulate_function').
+
+        'tile=<int>', 'threads=<int>' -- evaluate a ufunc one tile
+            at a time, optionally in several threads (see
+            'tabulate_function').
 
     Other keyword arguments are passed through to the Data
     constructor.
@@ -122,15 +863,98 @@ def compute_Data(xvals, f, ufunc=0, **keyw):
 
     """
 
+    if adaptive:
+        options = {}
+        for option in ['tolerance', 'max_evals', 'max_depth']:
+            if option in keyw:
+                options[option] = keyw[option]
+                del keyw[option]
+        (xvals, data) = tabulate_adaptive(
+            f, xvals, ufunc=ufunc, tile=tile, threads=threads,
+            cache=cache, cache_key=cache_key, **options
+            )
+        return Gnuplot.Data(xvals, data, **keyw)
+
     xvals = utils.float_array(xvals)
 
     # evaluate function:
-    data = tabulate_function(f, xvals, ufunc=ufunc)
+    data = tabulate_function(
+        f, xvals, ufunc=ufunc, workers=workers,
+        cache=cache, cache_key=cache_key, tile=tile, threads=threads,
+        )
 
     return Gnuplot.Data(xvals, data, **keyw)
 
 
-def compute_GridData(xvals, yvals, f, ufunc=0, **keyw):
+def _stream_GridData(xvals, yvals, f, ufunc, workers, blocksize,
+                     tile, threads, filename=None, **keyw):
+    """Tabulate 'f' a block at a time directly into a GridData file.
+
+    See 'compute_GridData'.
+
+    """
+
+    for option in ['inline', 'datablock', 'quantize', 'spill']:
+        if keyw.get(option):
+            raise Gnuplot.OptionError(
+                'streamed grid data can only be passed via a file '
+                'and cannot use %s' % (option,))
+        elif option in keyw:
+            del keyw[option]
+
+    binary = keyw.get('binary', 1) and gp.GnuplotOpts.recognizes_binary_splot
+    keyw['binary'] = binary
+    (numx, numy) = (len(xvals), len(yvals))
+
+    if workers is not None and workers > 1 and ufunc != 1:
+        # The same worker processes evaluate all of the blocks:
+        pool = _TabulationPool(f, workers)
+    else:
+        pool = None
+
+    tiles = _tile_shape(tile, threads, yvals)
+
+    def evaluate(xs, ys):
+        if pool is None or (
+            tiles and _tile_vectorizes(f, xs, ys, tiles)
+            ):
+            return tabulate_function(
+                f, xs, ys, ufunc=ufunc, tile=tile, threads=threads
+                )
+        else:
+            return _tabulate_points(f, xs, ys, None, ufunc, pool)[0]
+
+    if binary:
+        # The binary format (see 'GridData') holds one row per y value:
+        def write(out):
+            row = numpy.zeros((numx + 1,), numpy.float32)
+            row[0] = numx
+            row[1:] = xvals
+            out.write(row.tobytes())
+            for start in range(0, numy, blocksize):
+                ys = yvals[start:start + blocksize]
+                rows = numpy.zeros((len(ys), numx + 1), numpy.float32)
+                rows[:,0] = ys
+                rows[:,1:] = numpy.transpose(evaluate(xvals, ys))
+                out.write(rows.tobytes())
+    else:
+        # The text format holds 'x y f(x,y)' triplets, one block per x
+        # value:
+        def write(out):
+            for start in range(0, numx, blocksize):
+                xs = xvals[start:start + blocksize]
+                utils.write_grid(out, xs, yvals, evaluate(xs, yvals))
+
+    try:
+        return PlotItems._NewFileItem(write, filename=filename, **keyw)
+    finally:
+        if pool is not None:
+            pool.close()
+
+
+def compute_GridData(xvals, yvals, f, ufunc=0, workers=None, blocksize=None,
+                     cache=None, cache_key=None, tile=None, threads=None,
+                     **keyw):
     """Evaluate a function of 2 variables and store the results in a GridData.
 
     Computes a function 'f' of two variables on a rectangular grid
@@ -149,7 +973,28 @@ def compute_GridData(xvals, yvals, f, ufunc=0, **keyw):
         'f' -- the function to plot--a callable object for which
             'f(x,y)' returns a number.
 
-        'ufunc=<bool>' -- evaluate 'f' as a ufunc?
+        'ufunc=<bool>' -- evaluate 'f' as a ufunc?  (Or "auto"; see
+            'tabulate_function'.)
+
+        'workers=<int>' -- evaluate 'f' using this many processes
+            (see 'tabulate_function').
+
+        'blocksize=<int>' -- evaluate 'f' for this many values of y
+            (for binary data) or x (for text data) at a time, and
+            write each block to the data file before evaluating the
+            next, so that the full grid of values is never held in
+            memory.  The data are always written to a file (which is
+            temporary unless 'filename' is specified), so the
+            'inline', 'datablock', 'quantize', and 'spill' options of
+            'GridData' cannot be used.
+
+        'cache=<TabulationCache>', 'cache_key=<object>' -- look up
+            the values of 'f' in a cache (see 'tabulate_function').
+            Ignored if 'blocksize' is specified.
+
+        'tile=<int>', 'threads=<int>' -- evaluate a ufunc one tile
+            at a time, optionally in several threads (see
+            'tabulate_function').
 
      Other keyword arguments are passed to the 'GridData' constructor.
 
@@ -170,8 +1015,18 @@ def compute_GridData(xvals, yvals, f, ufunc=0, **keyw):
     xvals = utils.float_array(xvals)
     yvals = utils.float_array(yvals)
 
+    _check_tiling(ufunc, tile, threads)
+
+    if blocksize:
+        return _stream_GridData(
+            xvals, yvals, f, ufunc, workers, blocksize, tile, threads, **keyw
+            )
+
     # evaluate function:
-    data = tabulate_function(f, xvals, yvals, ufunc=ufunc)
+    data = tabulate_function(
+        f, xvals, yvals, ufunc=ufunc, workers=workers,
+        cache=cache, cache_key=cache_key, tile=tile, threads=threads,
+        )
 
     return Gnuplot.GridData(data, xvals, yvals, **keyw)
 
@@ -34,8 +34,15 @@ class GnuplotOpts:
     prefer_persist = 0
     recognizes_binary_splot = 1
     prefer_inline_data = 0
+    prefer_datablock_data = 0
     support_fifo = 0
     prefer_fifo_data = 0
+    temp_dir = None
+    spill_threshold = None
+    spill_dir = None
+    memory_limit = None
+    memory_policy = ('drop', 'spill')
+    worker_start_method = None
     default_term = 'x11'
     default_lpr = '| lpr'
     prefer_enhanced_postscript = 1
@@ -32,12 +32,30 @@ class GnuplotOpts:
     prefer_persist = 0
     recognizes_binary_splot = 1
     prefer_inline_data = 0
+    prefer_datablock_data = 0
 
     # os.mkfifo should be supported on Mac OS X.  Let me know if I'm
     # wrong.
     support_fifo = 1
     prefer_fifo_data = 1
 
+    # The directory for temporary files (see gp_unix.py):
+    temp_dir = None
+
+    # Move inline and FIFO data to a file once they have been sent
+    # if all data take a lot of memory (see gp_unix.py):
+    spill_threshold = None
+    spill_dir = None
+
+    # Limit the memory used by the data of all PlotItems (see
+    # gp_unix.py):
+    memory_limit = None
+    memory_policy = ('drop', 'spill')
+
+    # How to start the processes that evaluate functions for
+    # funcutils' 'workers' option (see gp_unix.py):
+    worker_start_method = None
+
     default_term = 'aqua'
     default_lpr = '| lpr'
     prefer_enhanced_postscript = 1
@@ -75,6 +75,14 @@ class GnuplotOpts:
     # big string when the PlotItem is created.
     prefer_inline_data = 0
 
+    # Recent versions of gnuplot (5.0 and later) can store data in a
+    # named datablock ('$name << EOD').  If prefer_datablock_data is
+    # true, then data are uploaded to gnuplot as datablocks by
+    # default.  Each datablock is uploaded once and afterwards only
+    # referred to by name, so 'replot' and 'hardcopy' don't transfer
+    # the data again.  Set this to 0 if your gnuplot is older.
+    prefer_datablock_data = 0
+
     # Does Python implement the threading module and os.mkfifo on this
     # operating system?  If so, the _FIFOFileItem class will be
     # defined in PlotItem.py.
@@ -83,6 +91,45 @@ class GnuplotOpts:
     # Should FIFOs be used to send data to gnuplot by default?
     prefer_fifo_data = 1
 
+    # Temporary files and FIFOs are created in a directory of their
+    # own (one per session; see tempfiles.py) within temp_dir.  If
+    # temp_dir is None, '/dev/shm' is used if it exists (so the data
+    # stay in memory rather than going to disk), and otherwise the
+    # default temporary directory.
+    temp_dir = None
+
+    # Inline and FIFO data are kept in memory by their PlotItems,
+    # because they are sent to gnuplot again each time the plot is
+    # redrawn.  Once the data held by all PlotItems take at least
+    # spill_threshold bytes, each item's data are moved to a
+    # temporary file in the directory spill_dir (or the temp_dir
+    # session directory if spill_dir is None) after they are sent,
+    # and copied from there afterwards.  A tmpfs directory such
+    # as '/dev/shm' makes the copying cheap.  Set spill_threshold to
+    # None to keep all data in memory unless the 'spill' option of an
+    # item says otherwise.
+    spill_threshold = None
+    spill_dir = None
+
+    # The total size of the data held in memory by all PlotItems can
+    # be limited to memory_limit bytes (None means no limit).  When an
+    # item would exceed the limit, the actions in memory_policy are
+    # tried in order until the total fits: 'drop' discards data that
+    # items not being plotted can compute again, 'spill' moves inline
+    # and FIFO data to files in spill_dir, and 'raise' raises
+    # Gnuplot.BudgetError.  See budget.py.
+    memory_limit = None
+    memory_policy = ('drop', 'spill')
+
+    # The multiprocessing start method ('fork', 'spawn', or
+    # 'forkserver') of the processes that evaluate functions for the
+    # 'workers' option of funcutils.tabulate_function().  None means
+    # the platform's default.  'fork' lets the function be a lambda
+    # or a closure, but forking while other threads are running (as
+    # FIFO writers are) can deadlock the child.  With the other
+    # methods, the function must be picklable.
+    worker_start_method = None
+
     # After a hardcopy is produced, we have to set the terminal type
     # back to `on screen' using gnuplot's `set terminal' command.  The
     # following is the usual setting for Xwindows.  If it is wrong,
@@ -45,10 +45,31 @@ class GnuplotOpts:
     # special reason:
     prefer_inline_data = 0
 
+    # Datablocks require gnuplot 5.0 or later, so don't use them by
+    # default:
+    prefer_datablock_data = 0
+
     # os.mkfifo is apparently not supported under Windows.
     support_fifo = 0
     prefer_fifo_data = 0
 
+    # The directory for temporary files (see gp_unix.py):
+    temp_dir = None
+
+    # Move inline and FIFO data to a file once they have been sent
+    # if all data take a lot of memory (see gp_unix.py):
+    spill_threshold = None
+    spill_dir = None
+
+    # Limit the memory used by the data of all PlotItems (see
+    # gp_unix.py):
+    memory_limit = None
+    memory_policy = ('drop', 'spill')
+
+    # How to start the processes that evaluate functions for
+    # funcutils' 'workers' option (see gp_unix.py):
+    worker_start_method = None
+
     # The default choice for the 'set term' command (to display on
     # screen):
     default_term = 'windows'
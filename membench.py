@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+# $Id$
+
+# This file is licensed under the GNU Lesser General Public License
+# (LGPL).  See LICENSE.txt for details.
+
+"""membench.py -- Measure the memory used by each PlotItem.
+
+Run this benchmark by typing 'python membench.py'.  It creates many
+items of a few common kinds and reports the average number of bytes
+allocated per item (including its option strings, but not data held
+in temporary files).  It requires Python 3.4 or later (for
+'tracemalloc').
+
+For reference, with Python 3.11 on a 64-bit machine, the three kinds
+of item below take about 280, 340, and 65 bytes.  Before PlotItem
+used '__slots__', per-class option tables, and shared option strings,
+each item stored its options in a dictionary of tuples and its
+attributes in an instance '__dict__'.  Running this same script on
+the revision just before that change (with the inverted type check in
+'File()' corrected, so that the second benchmark runs) gave about
+510, 620, and 160 bytes.
+
+"""
+
+import tracemalloc
+
+import Gnuplot
+
+
+def item_overhead(make, count=20000):
+    """Return the average number of bytes allocated by 'make()'."""
+
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        items = [make() for i in range(count)]
+        after = tracemalloc.get_traced_memory()[0]
+        # (The items have to stay alive until they are measured.)
+        del items
+    finally:
+        tracemalloc.stop()
+    # Don't count the list holding the items:
+    return (after - before) / float(count) - 8
+
+
+def main():
+    benchmarks = [
+        ("Func('sin(x)', title='s', with_='lines')",
+         lambda: Gnuplot.Func('sin(x)', title='s', with_='lines')),
+        ("File('data.dat', using=(1,2), title='s', with_='lines')",
+         lambda: Gnuplot.File(
+             'data.dat', using=(1,2), title='s', with_='lines'
+             )),
+        ("Func('x**2')",
+         lambda: Gnuplot.Func('x**2')),
+        ]
+    for (description, make) in benchmarks:
+        print('%6.0f bytes per %s' % (item_overhead(make), description,))
+
+
+# when executed, just run main():
+if __name__ == '__main__':
+    main()
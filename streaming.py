@@ -0,0 +1,270 @@
+# $Id$
+
+# This file is licensed under the GNU Lesser General Public License
+# (LGPL).  See LICENSE.txt for details.
+
+"""streaming.py -- Plot data that is being acquired while it is plotted.
+
+This module contains the pieces needed to plot a live data stream:
+
+    'RingBuffer' -- a fixed-capacity numpy buffer holding the most
+        recent data points.  Producers add points with 'append()' or
+        'extend()'.
+
+    'StreamData' -- a 'PlotItem' that plots the current contents of
+        a 'RingBuffer'.  The contents are copied out of the buffer
+        each time the item is sent to gnuplot, so the data are never
+        serialized more than once per frame.
+
+    'LiveRefresher' -- a thread that refreshes a 'Gnuplot' object at
+        a target frame rate.  If gnuplot cannot keep up, frames are
+        dropped rather than queued, so each frame sent shows the
+        current window of data.
+
+Producers only ever hold the buffer's lock for the time it takes to
+copy their new points into the buffer; they never wait on the pipe to
+gnuplot.  Example::
+
+    buf = Gnuplot.RingBuffer(10000, columns=2)
+    g = Gnuplot.Gnuplot()
+    g.plot(Gnuplot.StreamData(buf, with_='lines'))
+    refresher = Gnuplot.LiveRefresher(g, fps=30)
+    refresher.start()
+    while acquiring:
+        buf.extend(read_samples())
+    refresher.stop()
+
+"""
+
+import threading, time
+
+import numpy
+
+import utils, Errors
+from PlotItems import _FileItem
+
+
+class RingBuffer:
+    """A fixed-capacity circular buffer of data points.
+
+    The buffer holds at most 'capacity' points, each consisting of
+    'columns' values.  When it is full, adding new points discards
+    the oldest ones.  All methods are thread-safe.
+
+    Members:
+
+        'capacity' -- the maximum number of points held.
+
+        'columns' -- the number of values making up each point.
+
+        'version' -- a counter that is incremented each time points
+            are added or the buffer is cleared.
+
+    """
+
+    def __init__(self, capacity, columns=1, dtype=numpy.float64):
+        if capacity < 1:
+            raise Errors.OptionError('capacity must be positive')
+        self.capacity = capacity
+        self.columns = columns
+        self.version = 0
+        self._data = numpy.zeros((capacity, columns), dtype)
+        self._start = 0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._count
+
+    def append(self, point):
+        """Add a single point to the buffer."""
+
+        self.extend(numpy.reshape(point, (1, self.columns)))
+
+    def extend(self, points):
+        """Add a sequence of points to the buffer.
+
+        'points' should be convertible to an array of shape
+        '(n, columns)'; if 'columns' is 1, a 1-d array of length n is
+        also accepted.
+
+        """
+
+        points = numpy.asarray(points)
+        if points.ndim == 1 and self.columns == 1:
+            points = points[:,numpy.newaxis]
+        if points.ndim != 2 or points.shape[1] != self.columns:
+            raise Errors.DataError(
+                'points must have %d values each' % (self.columns,))
+        n = len(points)
+        if n > self.capacity:
+            # Only the most recent points can be kept anyway:
+            points = points[-self.capacity:]
+            n = self.capacity
+
+        self._lock.acquire()
+        try:
+            end = (self._start + self._count) % self.capacity
+            first = min(n, self.capacity - end)
+            self._data[end:end + first] = points[:first]
+            self._data[:n - first] = points[first:]
+            overflow = self._count + n - self.capacity
+            if overflow > 0:
+                self._start = (self._start + overflow) % self.capacity
+                self._count = self.capacity
+            else:
+                self._count += n
+            self.version += 1
+        finally:
+            self._lock.release()
+
+    def clear(self):
+        """Discard all points in the buffer."""
+
+        self._lock.acquire()
+        try:
+            self._start = 0
+            self._count = 0
+            self.version += 1
+        finally:
+            self._lock.release()
+
+    def window(self):
+        """Return a copy of the points in the buffer, oldest first."""
+
+        self._lock.acquire()
+        try:
+            end = self._start + self._count
+            if end <= self.capacity:
+                return self._data[self._start:end].copy()
+            else:
+                return numpy.concatenate((
+                    self._data[self._start:],
+                    self._data[:end - self.capacity],
+                    ))
+        finally:
+            self._lock.release()
+
+
+class StreamData(_FileItem):
+    """A PlotItem that plots the current contents of a 'RingBuffer'.
+
+    The data are sent to gnuplot inline.  A snapshot of the buffer is
+    taken each time the item is piped to gnuplot, so points added
+    while gnuplot is busy simply show up in the next frame.
+
+    """
+
+    def __init__(self, buffer, **keyw):
+        """Construct a 'StreamData' plotting the points in 'buffer'.
+
+        'buffer' is a 'RingBuffer'.  The keyword arguments recognized
+        by '_FileItem' can also be used here.
+
+        """
+
+        # If the user hasn't specified a title, set it to None so that
+        # '-' is not used:
+        if 'title' not in keyw:
+            keyw['title'] = None
+
+        if keyw.get('binary', 0):
+            raise Errors.OptionError('binary inline data is not supported')
+
+        self.buffer = buffer
+        _FileItem.__init__(self, '-', **keyw)
+
+    def pipein(self, f):
+        frame = self.buffer.window()
+        if len(frame):
+            utils.write_rows(f, frame)
+        f.write('e\n')
+
+
+class LiveRefresher(threading.Thread):
+    """A thread that refreshes a Gnuplot plot at a target frame rate.
+
+    Every 1/'fps' seconds, the thread calls 'gnuplot.refresh()' if the
+    contents of any 'StreamData' being plotted has changed since the
+    previous frame.  If a refresh takes longer than the frame period
+    (i.e., gnuplot falls behind), the frames that should have been
+    shown in the meantime are dropped rather than sent late.
+
+    Members:
+
+        'lock' -- a lock that is held while the plot is refreshed.
+            Hold it while sending other commands to the same Gnuplot
+            object from another thread.
+
+        'frames' -- the number of frames sent so far.
+
+        'dropped' -- the number of frames dropped so far.
+
+        'error' -- the exception raised by 'gnuplot.refresh()', if
+            any.  The thread stops refreshing when that happens, and
+            'stop()' and 'join()' raise the exception again.
+
+    """
+
+    def __init__(self, gnuplot, fps=30.0):
+        threading.Thread.__init__(self, name='Gnuplot live refresher')
+        self.daemon = True
+        self.gnuplot = gnuplot
+        self.period = 1.0 / fps
+        self.lock = threading.Lock()
+        self.frames = 0
+        self.dropped = 0
+        self.error = None
+        self._stopped = threading.Event()
+        self._versions = None
+
+    def _stream_versions(self):
+        return [
+            item.buffer.version
+            for item in self.gnuplot.itemlist
+            if isinstance(item, StreamData)
+            ]
+
+    def run(self):
+        next_frame = time.time()
+        while not self._stopped.is_set():
+            now = time.time()
+            if now < next_frame:
+                self._stopped.wait(next_frame - now)
+                continue
+
+            versions = self._stream_versions()
+            if versions != self._versions:
+                self.lock.acquire()
+                try:
+                    self.gnuplot.refresh()
+                except Exception as e:
+                    self.error = e
+                    return
+                finally:
+                    self.lock.release()
+                self._versions = versions
+                self.frames += 1
+
+            # Skip any frames that we are already too late for:
+            missed = int((time.time() - next_frame) / self.period)
+            self.dropped += missed
+            next_frame += (missed + 1) * self.period
+
+    def join(self, timeout=None):
+        """Wait for the thread to finish.
+
+        If the thread stopped because a refresh failed, raise the
+        exception that the refresh raised.
+
+        """
+
+        threading.Thread.join(self, timeout)
+        if self.error is not None and not self.is_alive():
+            raise self.error
+
+    def stop(self):
+        """Stop refreshing and wait for the thread to finish."""
+
+        self._stopped.set()
+        self.join()
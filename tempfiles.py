@@ -0,0 +1,320 @@
+# $Id$
+
+# This file is licensed under the GNU Lesser General Public License
+# (LGPL).  See LICENSE.txt for details.
+
+"""tempfiles.py -- Manage the temporary files used to pass data to gnuplot.
+
+All of the temporary files and FIFOs created by Gnuplot.py belong to a
+'TempSession'.  Each session has its own directory, which is created
+in 'gp.GnuplotOpts.temp_dir' (by default '/dev/shm' if it exists, so
+that the data never touch a disk, and otherwise the system's default
+temporary directory).  Files are deleted as soon as the items that use
+them are deleted, and whatever is left is deleted when the session is
+closed, so files are not left behind even if items are never garbage
+collected.
+
+Temporary files are created in the innermost session that the
+current thread has activated (see 'TempSession.activate'), or in a
+default session that is closed when Python exits.  All of the files of
+a PlotItem (including those created later, when it is plotted) belong
+to the session that was current when the item was created.  Each
+'Gnuplot' object has a session of its own, which is active within a
+'with' statement and closed by 'Gnuplot.close()'::
+
+    with Gnuplot.Gnuplot() as g:
+        g.plot(Gnuplot.Data(x, y))
+        ...
+    # The temporary files have been deleted here.
+
+A session can also create files in other directories (e.g.,
+'gp.GnuplotOpts.spill_dir'); it then uses a session directory of its
+own within each of them.  If a process is killed before it can clean
+up, its session directories are deleted by the next process that uses
+the same directories.
+
+"""
+
+import os, errno, shutil, tempfile, threading, weakref, atexit
+
+import gp
+
+
+# The prefix of the names of session directories:
+_prefix = 'gnuplot-py-'
+
+
+def temp_dir():
+    """Return the directory in which session directories are created."""
+
+    directory = gp.GnuplotOpts.temp_dir
+    if directory is None:
+        if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+            directory = '/dev/shm'
+        else:
+            directory = tempfile.gettempdir()
+    return directory
+
+
+def _process_exists(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno != errno.ESRCH
+    return True
+
+
+# The directories that have already been swept by this process:
+_swept = set()
+
+
+def sweep(directory=None):
+    """Delete the session directories of processes that no longer exist.
+
+    'directory' defaults to 'temp_dir()'.  Return the number of
+    session directories deleted.  This is done automatically the
+    first time this process creates a session directory in
+    'directory'.
+
+    """
+
+    if directory is None:
+        directory = temp_dir()
+    _swept.add(directory)
+    if os.name != 'posix':
+        # There is no safe way to check for a process:
+        return 0
+    count = 0
+    for name in os.listdir(directory):
+        if not name.startswith(_prefix):
+            continue
+        try:
+            pid = int(name[len(_prefix):].split('-')[0])
+        except ValueError:
+            continue
+        if pid != os.getpid() and not _process_exists(pid):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+            count += 1
+    return count
+
+
+# The sessions that each thread has activated (in a list 'sessions',
+# innermost last), and a lock for everything in this module:
+_active = threading.local()
+_lock = threading.RLock()
+
+# All open sessions:
+_sessions = weakref.WeakSet()
+
+# The session used when no other session is active:
+_default = None
+
+
+def _active_sessions():
+    """Return the list of sessions activated by the current thread."""
+
+    with _lock:
+        try:
+            return _active.sessions
+        except AttributeError:
+            _active.sessions = []
+            return _active.sessions
+
+
+class TempSession:
+    """A directory holding temporary files that are deleted together.
+
+    Members:
+
+        'directory' -- the session directory.  It is created when the
+            first file is created.  (Files created in another
+            directory go into a session directory of their own there.)
+
+        'closed' -- true after 'close()' has been called.
+
+    A session can be used as a context manager, which activates it
+    and closes it at the end of the 'with' statement.
+
+    """
+
+    def __init__(self, directory=None):
+        """Create a session in 'directory' (by default, 'temp_dir()')."""
+
+        self._base = directory
+        self.directory = None
+        self.closed = 0
+        self._files = {}
+        # The session directories, by the directory they are in:
+        self._directories = {}
+        _sessions.add(self)
+
+    def _directory(self, base=None):
+        """Return the session directory in 'base', creating it if needed.
+
+        'base' defaults to the directory given to the constructor (or
+        'temp_dir()'), in which case the result is 'self.directory'.
+
+        """
+
+        with _lock:
+            if self.closed:
+                raise ValueError('the temporary-file session is closed')
+            if base is None:
+                if self.directory is None:
+                    self.directory = self._directory(
+                        self._base or temp_dir()
+                        )
+                return self.directory
+            directory = self._directories.get(base)
+            if directory is None:
+                if base not in _swept:
+                    sweep(base)
+                directory = tempfile.mkdtemp(
+                    prefix='%s%d-' % (_prefix, os.getpid(),), dir=base
+                    )
+                self._directories[base] = directory
+            return directory
+
+    def mkstemp(self, suffix='', text=False, dir=None):
+        """Create a file as 'tempfile.mkstemp' does; return '(fd, name)'.
+
+        The file is created in the session directory, or if 'dir' is
+        given, in a session directory within 'dir' (so that 'sweep'
+        can delete it if this process dies).  Either way, it is
+        deleted when the session is closed if it has not been removed
+        before.
+
+        """
+
+        (fd, filename) = tempfile.mkstemp(
+            suffix=suffix, text=text, dir=self._directory(dir),
+            )
+        self._files[filename] = 0
+        return (fd, filename)
+
+    def mkdtemp(self, suffix=''):
+        """Create a directory within the session directory."""
+
+        dirname = tempfile.mkdtemp(suffix=suffix, dir=self._directory())
+        self._files[dirname] = 1
+        return dirname
+
+    def remove(self, name):
+        """Delete the file or directory 'name' created by this session.
+
+        Nothing happens if it has been deleted already.
+
+        """
+
+        isdir = self._files.pop(name, 0)
+        try:
+            if isdir:
+                shutil.rmtree(name)
+            else:
+                os.unlink(name)
+        except OSError:
+            pass
+
+    def stats(self):
+        """Return '(count, size)' for the files that still exist.
+
+        'size' is the total size of the files in bytes.  A directory
+        counts as one file, whose size is that of the files in it.
+
+        """
+
+        count = 0
+        size = 0
+        for (name, isdir) in list(self._files.items()):
+            try:
+                if isdir:
+                    for entry in os.listdir(name):
+                        size += os.path.getsize(os.path.join(name, entry))
+                else:
+                    size += os.path.getsize(name)
+            except OSError:
+                continue
+            count += 1
+        return (count, size)
+
+    def activate(self):
+        """Create the current thread's subsequent temporary files here.
+
+        Other threads are not affected.
+
+        """
+
+        with _lock:
+            _active_sessions().append(self)
+
+    def deactivate(self):
+        """Undo the current thread's most recent 'activate()' of this."""
+
+        with _lock:
+            active = _active_sessions()
+            for i in range(len(active) - 1, -1, -1):
+                if active[i] is self:
+                    del active[i]
+                    break
+
+    def close(self):
+        """Delete all remaining files and the session directory."""
+
+        with _lock:
+            # (Other threads forget the session when they next look
+            # for the current one.)
+            active = _active_sessions()
+            while self in active:
+                active.remove(self)
+            self.closed = 1
+            for name in list(self._files.keys()):
+                self.remove(name)
+            for directory in self._directories.values():
+                shutil.rmtree(directory, ignore_errors=True)
+
+    def __enter__(self):
+        self.activate()
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
+
+    def __del__(self):
+        self.close()
+
+
+def current_session():
+    """Return the session in which temporary files should be created."""
+
+    global _default
+
+    with _lock:
+        active = _active_sessions()
+        # Sessions closed by another thread are no longer active:
+        while active and active[-1].closed:
+            del active[-1]
+        if active:
+            return active[-1]
+        if _default is None or _default.closed:
+            _default = TempSession()
+        return _default
+
+
+def stats():
+    """Return '(count, size)' for the files of all open sessions."""
+
+    count = 0
+    size = 0
+    for session in list(_sessions):
+        (n, nbytes) = session.stats()
+        count += n
+        size += nbytes
+    return (count, size)
+
+
+def _cleanup():
+    if _default is not None:
+        _default.close()
+
+
+atexit.register(_cleanup)
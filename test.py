@@ -12,13 +12,18 @@
 This module is not meant to be a flashy demonstration; rather it is a
 thorough test of many combinations of Gnuplot.py features.
 
+'python test.py check' runs only the checks that don't need gnuplot or
+a terminal: they compare the data and commands that Gnuplot.py writes
+with what they should be, and stop at the first difference.
+
 """
 
-import os, time, math, tempfile
+import sys, os, time, math, gzip, shutil, subprocess, tempfile, threading
 import numpy
 
 try:
-    import Gnuplot, Gnuplot.PlotItems, Gnuplot.funcutils
+    import Gnuplot, Gnuplot.PlotItems, Gnuplot.funcutils, Gnuplot.utils
+    import Gnuplot.tempfiles
 except ImportError:
     # kludge in case Gnuplot hasn't been installed as a module yet:
     import __init__
@@ -27,6 +32,106 @@ except ImportError:
     Gnuplot.PlotItems = PlotItems
     import funcutils
     Gnuplot.funcutils = funcutils
+    import utils
+    Gnuplot.utils = utils
+    import tempfiles
+    Gnuplot.tempfiles = tempfiles
+
+
+def read(filename, opener=open):
+    f = opener(filename, 'rb')
+    try:
+        return f.read()
+    finally:
+        f.close()
+
+
+def commands(filename):
+    """Return the lines of the gnuplot command file 'filename'."""
+
+    return read(filename).decode('latin-1').splitlines()
+
+
+def plotted(filename):
+    """Return the lines of the inline data of the last plot command."""
+
+    lines = commands(filename)
+    for i in range(len(lines) - 1, -1, -1):
+        if lines[i].split()[:1] in [['plot'], ['splot']]:
+            break
+    return lines[i + 1:lines.index('e', i)]
+
+
+def write_array(filename, set):
+    f = open(filename, 'w')
+    try:
+        Gnuplot.utils.write_array(f, set)
+    finally:
+        f.close()
+
+
+def m4_reference(x, y, width):
+    """Return the indices kept by M4 decimation, the slow way."""
+
+    intervals = {}
+    for i in range(len(x)):
+        interval = int((x[i] - x[0]) * (width / float(x[-1] - x[0])))
+        intervals.setdefault(min(interval, width - 1), []).append(i)
+    kept = []
+    for indices in intervals.values():
+        values = [y[i] for i in indices]
+        kept.append(indices[0])
+        kept.append(indices[-1])
+        kept.append(indices[values.index(min(values))])
+        kept.append(indices[values.index(max(values))])
+    kept = list(set(kept))
+    kept.sort()
+    return kept
+
+
+def lttb_reference(x, y, threshold):
+    """Return the indices kept by LTTB downsampling, one bucket at a time."""
+
+    points = len(x)
+    buckets = threshold - 2
+    edges = [(i * (points - 2)) // buckets + 1 for i in range(buckets + 1)]
+    kept = [0]
+    for i in range(buckets):
+        if i + 1 < buckets:
+            cx = numpy.mean(x[edges[i + 1]:edges[i + 2]])
+            cy = numpy.mean(y[edges[i + 1]:edges[i + 2]])
+        else:
+            (cx, cy) = (x[-1], y[-1])
+        (ax, ay) = (x[kept[-1]], y[kept[-1]])
+        j = numpy.arange(edges[i], edges[i + 1])
+        area = numpy.absolute(
+            (ax - cx) * (y[j] - ay) - (ax - x[j]) * (cy - ay)
+            )
+        kept.append(edges[i] + numpy.argmax(area))
+    kept.append(points - 1)
+    return kept
+
+
+def write_grid_array(filename, m, xvals, yvals):
+    """Write the text data of a grid as one array, as GridData once did."""
+
+    write_array(filename, numpy.transpose(
+        numpy.array((
+            numpy.transpose(numpy.resize(xvals, (len(yvals), len(xvals)))),
+            numpy.resize(yvals, (len(xvals), len(yvals))),
+            m,
+            )),
+        (1,2,0),
+        ))
+
+
+# Module-level functions, which worker processes can unpickle:
+def saddle(x, y):
+    return x*x - y*y
+
+
+def reciprocal(x):
+    return 1.0/float(x)
 
 
 def wait(str=None, prompt='Press return to show results...\n'):
@@ -35,6 +140,594 @@ def wait(str=None, prompt='Press return to show results...\n'):
     raw_input(prompt)
 
 
+def check():
+    """Check what Gnuplot.py writes, without gnuplot or prompts."""
+
+    # Nobody reads the FIFOs here, so data are sent inline or through
+    # temporary files:
+    prefer_fifo_data = Gnuplot.GnuplotOpts.prefer_fifo_data
+    Gnuplot.GnuplotOpts.prefer_fifo_data = 0
+    dirname = tempfile.mkdtemp()
+    filename1 = os.path.join(dirname, 'data1')
+    filename2 = os.path.join(dirname, 'data2')
+    try:
+        print '############### check column-stacked Data ###################'
+        # Columns are interleaved as they are written; the file must be
+        # the same as when the stacked array is formatted at once:
+        x = numpy.arange(100)/5. - 10.
+        d = numpy.transpose((x, numpy.cos(x), numpy.sin(x)))
+        write_array(filename2, d)
+        Gnuplot.Data(x, numpy.cos(x), numpy.sin(x), filename=filename1)
+        assert read(filename1) == read(filename2)
+        Gnuplot.Data(d, filename=filename1)
+        assert read(filename1) == read(filename2)
+
+        print '############### check live refreshing #######################'
+        buf = Gnuplot.RingBuffer(5, columns=2)
+        buf.extend([(i, i*i) for i in range(8)])
+        assert buf.window().tolist() == [[i, i*i] for i in range(3, 8)]
+        g = Gnuplot.Gnuplot(filename=filename1)
+        g.plot(Gnuplot.StreamData(buf))
+        # A refresh that fails stops the refresher, and stop() raises
+        # the error again:
+        def refresh():
+            raise Gnuplot.Error('gnuplot went away')
+        g.refresh = refresh
+        refresher = Gnuplot.LiveRefresher(g, fps=100)
+        refresher.start()
+        for i in range(500):
+            if not refresher.is_alive():
+                break
+            time.sleep(0.01)
+        try:
+            refresher.stop()
+        except Gnuplot.Error:
+            pass
+        else:
+            raise AssertionError('the refresh error was lost')
+        assert not refresher.is_alive()
+        g.close()
+
+        print '############### check the settings cache ####################'
+        commandfile = os.path.join(dirname, 'commands')
+        g = Gnuplot.Gnuplot(filename=commandfile)
+        # (Skip the commands that set up the terminal.)
+        n = len(commands(commandfile))
+        g.title('Title')
+        g.title('Title')
+        g.set_range('xrange', (0, 10))
+        g.set_range('xrange', (0, 10))
+        assert commands(commandfile)[n:] == [
+            'set title "Title"', 'set xrange [0:10]',
+            ]
+        assert g.get_range('xrange') == (0.0, 10.0)
+        # A raw command that doesn't change the ranges keeps them:
+        g('set grid')
+        assert g.get_range('xrange') == (0.0, 10.0)
+        # but any raw command makes the settings be sent again:
+        g.title('Title')
+        g('set xr [-1:1]')
+        assert g.get_range('xrange') is None
+        g.set_range('xrange', (0, 10))
+        assert commands(commandfile)[n + 2:] == [
+            'set grid', 'set title "Title"', 'set xr [-1:1]',
+            'set xrange [0:10]',
+            ]
+        g.forget_settings()
+        assert g.get_range('xrange') is None
+        g.close()
+
+        print '############### check datablocks ############################'
+        g = Gnuplot.Gnuplot(filename=commandfile)
+        x = numpy.arange(100)/5. - 10.
+        d = Gnuplot.Data(x, numpy.cos(x), datablock=1)
+        upload = '%s << EOD' % (d.filename,)
+        # Replots and hardcopies refer to the datablock by name:
+        g.plot(d)
+        g.replot()
+        g.hardcopy(filename2)
+        assert commands(commandfile).count(upload) == 1
+        g('set title "session 3"; set grid')
+        g.replot()
+        assert commands(commandfile).count(upload) == 1
+        # but commands that might delete it make it be uploaded again:
+        for s in ['undef %s' % (d.filename,), 'set grid; reset session']:
+            g(s)
+            g.replot()
+        assert commands(commandfile).count(upload) == 3
+        g.close()
+
+        print '############### check the cached plot commands ##############'
+        f = Gnuplot.Func('sin(x)', title='Sine')
+        s = f.command()
+        assert s == 'sin(x) title "Sine"'
+        assert f.command() is s
+        # Changing an option rebuilds the command:
+        f.set_option(with_='lines')
+        assert f.command() == 'sin(x) title "Sine" with lines'
+        f.clear_option('with')
+        assert f.command() == s
+
+        print '############### check M4 decimation #########################'
+        random = numpy.random.RandomState(30)
+        x = numpy.sort(random.uniform(0.0, 10.0, 5000))
+        y = numpy.cumsum(random.normal(size=5000))
+        kept = Gnuplot.utils.m4_indices(x, y, 300)
+        assert list(kept) == m4_reference(x, y, 300)
+        Gnuplot.Data(x, y, decimate='m4', width=300, filename=filename1)
+        write_array(filename2, numpy.transpose((x[kept], y[kept])))
+        assert read(filename1) == read(filename2)
+
+        print '############### check LTTB downsampling #####################'
+        random = numpy.random.RandomState(31)
+        x = numpy.sort(random.uniform(0.0, 10.0, 5000))
+        for y in [
+            random.normal(size=5000),
+            numpy.cumsum(random.normal(size=5000)),
+            x**2,
+            ]:
+            kept = Gnuplot.utils.lttb_indices(x, y, 200)
+            assert list(kept) == lttb_reference(x, y, 200)
+
+        print '############### check the grid pyramid ######################'
+        m = numpy.random.RandomState(32).uniform(size=(64, 48))
+        p = Gnuplot.GridPyramid(m, width=16, height=16, binary=0, inline=1)
+        assert [level[0].shape for level in p.levels] == [
+            (64, 48), (32, 24), (16, 12),
+            ]
+        assert numpy.allclose(
+            p.levels[1][0], m.reshape(32, 2, 24, 2).mean(3).mean(1)
+            )
+        g = Gnuplot.Gnuplot(filename=commandfile)
+        g.splot(p)
+        # (The coarsest level is shorter than 'height' in y.)
+        assert p.selection == (1, 0, 32, 0, 24)
+        # Zooming in switches to a finer level:
+        g.set_range('xrange', (8, 24))
+        g.replot()
+        assert p.selection == (0, 8, 25, 0, 48)
+        g.close()
+
+        print '############### check histograms ############################'
+        random = numpy.random.RandomState(33)
+        data = random.normal(size=(1000, 3))
+        weights = random.uniform(size=(1000, 3))
+        data[::7, 1] = numpy.nan
+        data[5, 0] = numpy.inf
+        finite = numpy.isfinite(data)
+        for limits in [None, (-1.0, 2.0)]:
+            expected = numpy.histogram(
+                data[finite], 20, limits, weights=weights[finite]
+                )
+            # The same data in memory and a few rows at a time:
+            for chunksize in [None, 100, 7]:
+                (counts, edges) = Gnuplot.utils.histogram(
+                    data, 20, limits, weights=weights, chunksize=chunksize
+                    )
+                assert numpy.allclose(counts, expected[0])
+                assert numpy.allclose(edges, expected[1])
+
+        print '############### check 2-d binning ###########################'
+        random = numpy.random.RandomState(34)
+        (x, y) = random.normal(size=(2, 10000))
+        x[::9] = 2.0
+        # (The last x range has zero width.)
+        for limits in [
+            None,
+            ((-1.0, 1.5), (0.0, 2.0)),
+            ((2.0, 2.0), (y.min(), y.max())),
+            ]:
+            (counts, sums, xedges, yedges) = Gnuplot.utils.bin2d(
+                x, y, (30, 20), limits, values=x, chunksize=999
+                )
+            expected = numpy.histogram2d(x, y, (30, 20), limits)
+            assert numpy.all(counts == expected[0])
+            assert numpy.allclose(xedges, expected[1])
+            assert numpy.allclose(yedges, expected[2])
+            assert numpy.allclose(
+                sums, numpy.histogram2d(x, y, (30, 20), limits, weights=x)[0]
+                )
+        try:
+            Gnuplot.Density2D(x, y, spill=1, filename=filename1)
+        except Gnuplot.OptionError:
+            pass
+        else:
+            raise AssertionError('data saved to a file were spilled')
+        Gnuplot.Density2D(x, y, bins=(30, 20), spill=1)
+
+        print '############### check culled data ###########################'
+        g = Gnuplot.Gnuplot(filename=commandfile)
+        x = numpy.arange(1000)/50. - 10.
+        y = numpy.sin(x)
+        d = Gnuplot.Data(x, y, cull=1, inline=1, with_='lines')
+        # Nothing is selected before the item is plotted, and changing
+        # the arrays passed in doesn't change the item:
+        assert d.selection is Gnuplot.PlotItems._unset
+        y[:] = 0.0
+        g.set_range('xrange', (-5, 5))
+        g.plot(d)
+        assert d.selection[0] == (-5.0, 5.0)
+        # The points within the range and one more on either side:
+        lines = [line.split() for line in plotted(commandfile) if line]
+        assert len(lines) == 503
+        assert numpy.allclose(
+            [float(v) for v in lines[0]], [x[249], numpy.sin(x[249])]
+            )
+        # A command that doesn't change the ranges doesn't hide them:
+        g.set_range('xrange', None)
+        g('set grid')
+        g.replot()
+        assert d.selection[0] == (None, None)
+        assert len(plotted(commandfile)) == 1001
+        # Discarded data are selected again when they are needed:
+        d._drop_content()
+        g.replot()
+        assert d.selection[0] == (None, None)
+        assert len(plotted(commandfile)) == 1001
+        g.close()
+
+        print '############### check adaptive sampling #####################'
+        f = lambda x: numpy.tanh(20.0*x)
+        xvals = numpy.linspace(-1.0, 1.0, 11)
+        x = numpy.linspace(-1.0, 1.0, 20001)
+        for tolerance in [1.0e-2, 1.0e-4]:
+            (xa, ya) = Gnuplot.funcutils.tabulate_adaptive(
+                f, xvals, tolerance, ufunc=1
+                )
+            assert numpy.all(numpy.diff(xa) > 0)
+            assert numpy.all(ya == f(xa))
+            # Straight lines between the points stay within tolerance:
+            error = numpy.absolute(numpy.interp(x, xa, ya) - f(x)).max()
+            assert error <= tolerance
+        (xa, ya) = Gnuplot.funcutils.tabulate_adaptive(
+            f, xvals, 1.0e-4, max_evals=20, ufunc=1
+            )
+        assert len(xa) <= len(xvals) + 20
+
+        print '############### check the min/max index #####################'
+        random = numpy.random.RandomState(37)
+        x = numpy.cumsum(random.uniform(size=100000))
+        y = numpy.cumsum(random.normal(size=100000))
+        indexdir = os.path.join(dirname, 'index')
+        index = Gnuplot.utils.MinMaxIndex(x, y, directory=indexdir)
+        for (xmin, xmax) in [(None, None), (x[1000], x[90000]), (x[5], x[9])]:
+            kept = index.select(xmin, xmax, width=100)
+            window = numpy.arange(len(x))
+            if xmin is not None:
+                window = window[(x >= xmin) & (x <= xmax)]
+                window = numpy.arange(window[0] - 1, window[-1] + 2)
+            if len(window) <= 8 * 100:
+                assert list(kept) == list(window)
+            else:
+                # The points needed to draw the window with lines:
+                assert len(kept) <= 4 * 100
+                assert kept[0] == window[0] and kept[-1] == window[-1]
+                assert window[numpy.argmin(y[window])] in kept
+                assert window[numpy.argmax(y[window])] in kept
+            # The saved index gives the same results:
+            loaded = Gnuplot.utils.MinMaxIndex(x, y, directory=indexdir)
+            assert list(loaded.select(xmin, xmax, width=100)) == list(kept)
+        g = Gnuplot.Gnuplot(filename=commandfile)
+        z = Gnuplot.ZoomData(x, y, width=100, index=index, inline=1)
+        g.set_range('xrange', (x[1000], x[90000]))
+        g.plot(z)
+        kept = index.select(x[1000], x[90000], width=100)
+        assert z.selection == (x[1000], x[90000])
+        assert len(plotted(commandfile)) == len(kept) + 1
+        g.close()
+
+        print '############### check quantized data ########################'
+        random = numpy.random.RandomState(38)
+        a = random.normal(size=1000)
+        a[::50] = numpy.nan
+        for dtype in [numpy.int8, numpy.uint8, numpy.int16, numpy.uint16]:
+            (codes, scale, offset, missing) = Gnuplot.utils.quantize(a, dtype)
+            assert codes.dtype == dtype
+            assert numpy.all(codes[numpy.isnan(a)] == missing)
+            finite = numpy.isfinite(a)
+            # The values are rounded to the nearest step:
+            error = numpy.absolute(codes[finite]*scale + offset - a[finite])
+            assert error.max() <= 0.5*scale*(1.0 + 1.0e-9)
+        x = numpy.arange(1000)/50. - 10.
+        Gnuplot.Data(x, a, quantize='int16', filename=filename1)
+        assert len(read(filename1)) == 2 * 2 * 1000
+        try:
+            Gnuplot.Data(x, a, quantize='int16', cull=1)
+        except Gnuplot.OptionError:
+            pass
+        else:
+            raise AssertionError('quantized data were culled')
+
+        print '############### check compressed data #######################'
+        x = numpy.arange(100)/5. - 10.
+        d = numpy.transpose((x, numpy.cos(x), numpy.sin(x)))
+        write_array(filename2, d)
+        item = Gnuplot.Data(d, filename=filename1, compress='gzip')
+        assert read(filename1, gzip.open) == read(filename2)
+        assert item.get_base_command_string() == (
+            '"< gzip -dc %s"' % (filename1,)
+            )
+        # Each chunk is a gzip member of its own, compressed by one of
+        # several threads, but they are written in order:
+        f = open(filename1, 'wb')
+        Gnuplot.utils.write_gzip(f, read(filename2), chunksize=1000, threads=3)
+        f.close()
+        assert read(filename1, gzip.open) == read(filename2)
+
+        print '############### check ufunc detection #######################'
+        x = numpy.arange(100)/5. - 10.
+        y = numpy.arange(30)/10.0 - 1.5
+        tabulate = Gnuplot.funcutils.tabulate_function
+        (m, strategy) = tabulate(
+            lambda x,y: numpy.sin(x)*y, x, y, ufunc='auto', return_strategy=1
+            )
+        assert strategy == 'ufunc'
+        assert numpy.allclose(m, numpy.sin(x)[:,numpy.newaxis]*y)
+        (m, strategy) = tabulate(
+            lambda x,y: math.sin(x)*y, x, y, ufunc='auto', return_strategy=1
+            )
+        assert strategy == 'frompyfunc'
+        assert numpy.allclose(m, numpy.sin(x)[:,numpy.newaxis]*y)
+        # A function that accepts arrays but combines the points is
+        # evaluated one point at a time:
+        (m, strategy) = tabulate(
+            lambda x: x - numpy.mean(x), x, ufunc='auto', return_strategy=1
+            )
+        assert strategy == 'frompyfunc'
+        assert numpy.all(m == 0.0)
+
+        print '############### check worker processes ######################'
+        x = numpy.arange(100)/5. - 10.
+        y = numpy.arange(30)/10.0 - 1.5
+        m = Gnuplot.funcutils.tabulate_function(saddle, x, y, workers=3)
+        assert numpy.all(
+            m == Gnuplot.funcutils.tabulate_function(saddle, x, y)
+            )
+        # An error in a worker is reported with the point where it
+        # happened (x is 0 at index 50):
+        try:
+            Gnuplot.funcutils.tabulate_function(reciprocal, x, workers=3)
+        except Gnuplot.DataError as e:
+            assert 'x=0.0' in str(e) and 'ZeroDivisionError' in str(e)
+        else:
+            raise AssertionError('the error in the worker was lost')
+
+        print '############### check streamed grid data ####################'
+        x = numpy.arange(35)/2.0
+        y = numpy.arange(30)/10.0 - 1.5
+        f = lambda x,y: numpy.sin(x) + 0.1*x - y**2
+        m = f(x[:,numpy.newaxis], y[numpy.newaxis,:])
+        # The grid is computed and written a block at a time:
+        write_grid_array(filename2, m, x, y)
+        Gnuplot.funcutils.compute_GridData(
+            x, y, f, ufunc=1, binary=0, blocksize=7, filename=filename1)
+        assert read(filename1) == read(filename2)
+        Gnuplot.GridData(m, x, y, binary=1, filename=filename2)
+        Gnuplot.funcutils.compute_GridData(
+            x, y, f, ufunc=1, binary=1, blocksize=7, filename=filename1)
+        assert read(filename1) == read(filename2)
+        for option in ['inline', 'datablock', 'quantize', 'spill']:
+            keyw = {option : 1}
+            try:
+                Gnuplot.funcutils.compute_GridData(
+                    x, y, f, ufunc=1, blocksize=7, **keyw)
+            except Gnuplot.OptionError:
+                pass
+            else:
+                raise AssertionError('streamed grid data used %s' % (option,))
+
+        print '############### check the tabulation cache ##################'
+        cache = Gnuplot.funcutils.TabulationCache(
+            os.path.join(dirname, 'cache')
+            )
+        calls = []
+        def f(x):
+            calls.append(len(x))
+            return numpy.cos(x)
+        x = numpy.arange(100)/5. - 10.
+        tabulate = Gnuplot.funcutils.tabulate_function
+        m = tabulate(f, x, ufunc=1, cache=cache, cache_key='cos')
+        assert numpy.all(m == numpy.cos(x)) and len(calls) == 1
+        (m, strategy) = tabulate(
+            f, x, ufunc=1, cache=cache, cache_key='cos', return_strategy=1
+            )
+        assert numpy.all(m == numpy.cos(x)) and len(calls) == 1
+        assert strategy == 'cache' and (cache.hits, cache.misses) == (1, 1)
+        tabulate(f, x[1:], ufunc=1, cache=cache, cache_key='cos')
+        tabulate(f, x, ufunc=1, cache=cache, cache_key='cos 2')
+        assert len(calls) == 3
+        # When the cache is full, the results whose files were used
+        # least recently are deleted (a hit updates the file's mtime):
+        cache.clear()
+        keys = [cache.key('cos', x[i:], ufunc=1) for i in range(3)]
+        names = [os.path.join(cache.directory, k + '.npy') for k in keys]
+        cache.put(keys[0], numpy.cos(x))
+        cache.put(keys[1], numpy.cos(x[1:]))
+        cache.max_bytes = os.path.getsize(names[0]) + os.path.getsize(names[1])
+        now = time.time()
+        os.utime(names[0], (now - 200, now - 200))
+        os.utime(names[1], (now - 100, now - 100))
+        assert cache.get(keys[0]) is not None
+        cache.put(keys[2], numpy.cos(x[2:]))
+        assert [os.path.exists(name) for name in names] == [1, 0, 1]
+        cache.clear()
+        assert cache.get(keys[0]) is None
+
+        print '############### check tiled evaluation ######################'
+        x = numpy.arange(100)/5. - 10.
+        y = numpy.arange(30)/10.0 - 1.5
+        f = lambda x,y: numpy.sin(x) + 0.1*x - y**2
+        m = f(x[:,numpy.newaxis], y[numpy.newaxis,:])
+        tabulate = Gnuplot.funcutils.tabulate_function
+        for threads in [None, 4]:
+            (t, strategy) = tabulate(
+                f, x, y, ufunc=1, tile=(16, 8), threads=threads,
+                return_strategy=1,
+                )
+            assert strategy == 'tiles' and numpy.all(t == m)
+            # The type of the result suits all of the tiles, not just
+            # the first one (which is of integers here):
+            g = lambda x: x if x[-1] >= 0 else numpy.floor(x).astype(int)
+            t = tabulate(g, x, ufunc=1, tile=16, threads=threads)
+            assert t.dtype == numpy.float64
+            assert numpy.all(t == numpy.concatenate([
+                g(x[i:i + 16]) for i in range(0, len(x), 16)
+                ]))
+
+        print '############### check text GridData #########################'
+        x = numpy.arange(35)/2.0
+        y = numpy.arange(30)/10.0 - 1.5
+        m = (numpy.sin(x[:,numpy.newaxis]) + 0.1*x[:,numpy.newaxis]
+             - y[numpy.newaxis,:]**2)
+        # The triplets are formatted a few rows at a time, but the file
+        # is the same as for the whole array of triplets:
+        write_grid_array(filename2, m, x, y)
+        Gnuplot.GridData(m, x, y, binary=0, filename=filename1)
+        assert read(filename1) == read(filename2)
+        f = open(filename1, 'w')
+        Gnuplot.utils.write_grid(f, x, y, m, chunksize=50)
+        f.close()
+        assert read(filename1) == read(filename2)
+
+        print '############### check spilled data ##########################'
+        g = Gnuplot.Gnuplot(filename=commandfile)
+        x = numpy.arange(1000)/50. - 10.
+        d = Gnuplot.Data(x, numpy.cos(x), inline=1, spill=1)
+        assert Gnuplot.memory_budget.size(d) > 0
+        # The data are moved to a file once they have been sent:
+        g.plot(d)
+        sent = plotted(commandfile)
+        assert isinstance(d.content, Gnuplot.PlotItems._SpilledContent)
+        assert Gnuplot.memory_budget.size(d) == 0
+        spillfile = d.content.filename
+        assert os.path.exists(spillfile)
+        g.replot()
+        assert plotted(commandfile) == sent
+        # By default, data are spilled once all data take at least
+        # spill_threshold bytes:
+        d = Gnuplot.Data(x, numpy.sin(x), inline=1)
+        g.plot(d)
+        assert not os.path.exists(spillfile)
+        assert not isinstance(d.content, Gnuplot.PlotItems._SpilledContent)
+        spill_threshold = Gnuplot.GnuplotOpts.spill_threshold
+        Gnuplot.GnuplotOpts.spill_threshold = 0
+        try:
+            g.replot()
+        finally:
+            Gnuplot.GnuplotOpts.spill_threshold = spill_threshold
+        assert isinstance(d.content, Gnuplot.PlotItems._SpilledContent)
+        try:
+            Gnuplot.Data(x, spill=1, filename=filename1)
+        except Gnuplot.OptionError:
+            pass
+        else:
+            raise AssertionError('data saved to a file were spilled')
+        g.close()
+
+        print '############### check the memory budget #####################'
+        budget = Gnuplot.memory_budget
+        x = numpy.arange(20000)/1000. - 10.
+        memory_limit = Gnuplot.GnuplotOpts.memory_limit
+        memory_policy = Gnuplot.GnuplotOpts.memory_policy
+        try:
+            # 'raise': data that don't fit are not accepted:
+            a = Gnuplot.Data(x, numpy.cos(x), inline=1)
+            size = budget.size(a)
+            Gnuplot.GnuplotOpts.memory_limit = budget.total + size // 2
+            Gnuplot.GnuplotOpts.memory_policy = ('raise',)
+            total = budget.total
+            try:
+                Gnuplot.Data(x, numpy.sin(x), inline=1)
+            except Gnuplot.BudgetError:
+                pass
+            else:
+                raise AssertionError('the memory limit was exceeded')
+            assert budget.total == total
+            # 'spill': the largest inline data are moved to a file:
+            Gnuplot.GnuplotOpts.memory_policy = ('spill',)
+            b = Gnuplot.Data(x, numpy.sin(x), inline=1)
+            spilled = [
+                item for item in [a, b]
+                if isinstance(item.content, Gnuplot.PlotItems._SpilledContent)
+                ]
+            assert len(spilled) == 1 and budget.size(spilled[0]) == 0
+            assert budget.total <= Gnuplot.GnuplotOpts.memory_limit
+            del a, b, spilled
+            # 'drop': data that can be selected again are discarded,
+            # unless they are being plotted:
+            Gnuplot.GnuplotOpts.memory_limit = None
+            Gnuplot.GnuplotOpts.memory_policy = ('drop',)
+            g = Gnuplot.Gnuplot(filename=commandfile)
+            c = Gnuplot.Data(x, numpy.cos(x), cull=1, inline=1)
+            g.plot(c)
+            size = budget.size(c)
+            assert size > 0
+            Gnuplot.GnuplotOpts.memory_limit = budget.total
+            Gnuplot.Data(x[:1000], inline=1)
+            assert budget.size(c) == size
+            g.plot(Gnuplot.Func('sin(x)'))
+            Gnuplot.GnuplotOpts.memory_limit = budget.total
+            Gnuplot.Data(x[:1000], inline=1)
+            assert budget.size(c) == 0
+            assert c.selection is Gnuplot.PlotItems._unset
+            g.plot(c)
+            assert budget.size(c) == size
+            g.close()
+        finally:
+            Gnuplot.GnuplotOpts.memory_limit = memory_limit
+            Gnuplot.GnuplotOpts.memory_policy = memory_policy
+
+        print '############### check temporary-file sessions ###############'
+        tempfiles = Gnuplot.tempfiles
+        base = os.path.join(dirname, 'temp')
+        spill = os.path.join(dirname, 'spill')
+        os.mkdir(base)
+        os.mkdir(spill)
+        # The session directory of a process that no longer exists:
+        p = subprocess.Popen([sys.executable, '-c', 'pass'])
+        p.wait()
+        orphan = os.path.join(spill, '%s%d-x' % (tempfiles._prefix, p.pid,))
+        os.mkdir(orphan)
+        session = Gnuplot.TempSession(base)
+        session.activate()
+        try:
+            assert tempfiles.current_session() is session
+            # Activating a session doesn't affect other threads:
+            other = []
+            thread = threading.Thread(
+                target=lambda: other.append(tempfiles.current_session())
+                )
+            thread.start()
+            thread.join()
+            assert other[0] is not session
+            (fd, name) = session.mkstemp(suffix='.gnuplot')
+            os.close(fd)
+            assert os.path.dirname(name) == session.directory
+            assert os.path.dirname(session.directory) == base
+            # Files in another directory go into a session directory
+            # there, which is swept first:
+            (fd, spillname) = session.mkstemp(suffix='.gnuplot', dir=spill)
+            os.close(fd)
+            spilldir = os.path.dirname(spillname)
+            assert os.path.dirname(spilldir) == spill
+            assert os.path.basename(spilldir).startswith(
+                '%s%d-' % (tempfiles._prefix, os.getpid(),)
+                )
+            assert not os.path.exists(orphan)
+            assert session.stats()[0] == 2
+        finally:
+            session.close()
+        assert tempfiles.current_session() is not session
+        assert os.listdir(base) == [] and os.listdir(spill) == []
+        os.mkdir(orphan)
+        assert tempfiles.sweep(spill) == 1 and not os.path.exists(orphan)
+
+        print 'All checks passed.'
+    finally:
+        Gnuplot.GnuplotOpts.prefer_fifo_data = prefer_fifo_data
+        shutil.rmtree(dirname)
+
+
 def main():
     """Exercise the Gnuplot module."""
 
@@ -345,7 +1038,10 @@ def main():
         os.unlink(filename2)
 
 
-# when executed, just run main():
+# when executed, just run main() (or check()):
 if __name__ == '__main__':
-    main()
+    if sys.argv[1:] == ['check']:
+        check()
+    else:
+        main()
 
@@ -12,7 +12,14 @@ particularly gnuplot-related.
 
 """
 
-import string
+import os, io, gzip, string, threading, multiprocessing, collections
+
+try:
+    import queue
+except ImportError:
+    # for Python 2:
+    import Queue as queue
+
 import numpy
 
 def float_array(m):
@@ -90,3 +97,821 @@ def write_array(f, set,
             write_array(f, subset,
                         item_sep, nest_prefix, nest_suffix, nest_sep)
 
+
+def write_rows(f, set, item_sep=' ', chunksize=4096):
+    """Write a 2-d array to a file, one data point per line.
+
+    The lines are the same as those written by 'write_array' for a
+    2-d array (without the trailing blank line), but 'chunksize' rows
+    are formatted by a single string-formatting operation rather than
+    one at a time, which is much faster for long arrays.
+
+    """
+
+    (points, columns) = set.shape
+    line = item_sep.join(['%s'] * columns) + '\n'
+    for i in range(0, points, chunksize):
+        chunk = set[i:i + chunksize]
+        f.write((line * len(chunk)) % tuple(chunk.ravel().tolist()))
+
+
+def write_columns(f, columns, item_sep=' ', chunksize=4096):
+    """Write 1-d arrays to a file as the columns of a table.
+
+    The lines are the same as those written by 'write_rows' for the
+    2-d array whose columns are 'columns', but that array is never
+    built: 'chunksize' rows at a time are interleaved from the
+    original arrays, so no copy of all of the data is made and the
+    arrays may be non-contiguous views.
+
+    """
+
+    points = len(columns[0])
+    line = item_sep.join(['%s'] * len(columns)) + '\n'
+    chunk = numpy.empty((min(chunksize, points), len(columns)))
+    for i in range(0, points, chunksize):
+        n = min(chunksize, points - i)
+        for (j, column) in enumerate(columns):
+            chunk[:n,j] = column[i:i + n]
+        f.write((line * n) % tuple(chunk[:n].ravel().tolist()))
+
+
+def write_grid(f, xvals, yvals, data, item_sep=' ', chunksize=4096):
+    """Write a function tabulated on a grid as 'x y f(x,y)' triplets.
+
+    'data[i,j]' is the value at '(xvals[i], yvals[j])'.  The lines are
+    the same as those written by 'write_array' for the 3-d array of
+    triplets (one block per x value, each followed by a blank line),
+    but that array is never built: the triplets for about 'chunksize'
+    points at a time are filled into a small buffer and formatted by a
+    single string-formatting operation.
+
+    """
+
+    (numx, numy) = data.shape
+    rows = max(1, chunksize // max(numy, 1))
+    block = (item_sep.join(['%s'] * 3) + '\n') * numy + '\n'
+    triplets = numpy.empty((min(rows, numx), numy, 3))
+    triplets[:,:,1] = yvals
+    for i in range(0, numx, rows):
+        n = min(rows, numx - i)
+        triplets[:n,:,0] = numpy.asarray(xvals[i:i + n])[:,numpy.newaxis]
+        triplets[:n,:,2] = data[i:i + n]
+        f.write((block * n) % tuple(triplets[:n].ravel().tolist()))
+
+
+def quantize(a, dtype=numpy.int16):
+    """Scale the values in 'a' to fit into an integer type.
+
+    The finite values of 'a' are mapped linearly onto the range of
+    the integer type 'dtype' (e.g., 'numpy.int16' or 'numpy.uint8')
+    and rounded.  If 'a' contains non-finite values, the smallest
+    integer is reserved for them and the others are mapped onto the
+    rest of the range.
+
+    Return '(codes, scale, offset, missing)', where 'codes' is an
+    integer array with the shape of 'a', the original values are
+    approximately 'codes * scale + offset', and 'missing' is the code
+    used for non-finite values (or None).  The error of each value is
+    at most 'scale / 2', i.e. '(max - min) / (2 * (n - 1))' where 'n'
+    is the number of codes used: for 16-bit types this is about
+    0.0008% of the range of the values, and for 8-bit types about 0.2%.
+
+    """
+
+    a = numpy.asarray(a)
+    info = numpy.iinfo(dtype)
+    finite = numpy.isfinite(a)
+    lo = info.min
+    if finite.all():
+        missing = None
+    else:
+        missing = lo
+        lo += 1
+    if finite.any():
+        (vmin, vmax) = (float(a[finite].min()), float(a[finite].max()))
+    else:
+        (vmin, vmax) = (0.0, 0.0)
+    if vmax > vmin:
+        scale = (vmax - vmin) / (float(info.max) - lo)
+    else:
+        scale = 1.0
+    offset = vmin - lo * scale
+    codes = numpy.rint((numpy.where(finite, a, vmin) - vmin) / scale) + lo
+    codes = numpy.clip(codes, lo, info.max).astype(dtype)
+    if missing is not None:
+        codes[~finite] = missing
+    return (codes, scale, offset, missing)
+
+
+def _gzip_member(data, level):
+    """Return 'data' compressed as a complete gzip member."""
+
+    buf = io.BytesIO()
+    g = gzip.GzipFile(fileobj=buf, mode='wb', compresslevel=level, mtime=0)
+    g.write(data)
+    g.close()
+    return buf.getvalue()
+
+
+class GzipWriter:
+    """A file-like object that compresses what is written to it in parallel.
+
+    The data written to a 'GzipWriter' (strings, which are encoded as
+    UTF-8, or bytes) are collected into chunks of about 'chunksize'
+    bytes, which are compressed by 'threads' threads (by default one
+    per CPU, up to 8; zlib releases the interpreter lock while it
+    works) and written in order to the binary file 'f'.  Each chunk is
+    a separate gzip member; gzip decompresses consecutive members as
+    a single stream.  At most two chunks per thread are held at a
+    time, so the memory used doesn't depend on the amount of data.
+    'close()' must be called to write the last chunk; it does not
+    close 'f'.
+
+    """
+
+    def __init__(self, f, level=6, chunksize=2**20, threads=None):
+        if threads is None:
+            try:
+                threads = min(multiprocessing.cpu_count(), 8)
+            except NotImplementedError:
+                threads = 1
+        self.f = f
+        self.level = level
+        self.chunksize = chunksize
+        self._buffer = []
+        self._buffered = 0
+        self._chunks = 0
+        # The chunks being compressed, in order, as lists '[event,
+        # member, error]':
+        self._pending = collections.deque()
+        self._limit = 2 * max(1, threads)
+        self._tasks = queue.Queue()
+        self._workers = []
+        for i in range(max(1, threads)):
+            worker = threading.Thread(target=self._compress)
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def _compress(self):
+        while True:
+            task = self._tasks.get()
+            if task is None:
+                return
+            (result, data) = task
+            try:
+                result[1] = _gzip_member(data, self.level)
+            except Exception as e:
+                result[2] = e
+            result[0].set()
+
+    def _write_next(self):
+        result = self._pending.popleft()
+        result[0].wait()
+        if result[2] is not None:
+            raise result[2]
+        self.f.write(result[1])
+
+    def _submit(self, data):
+        while len(self._pending) >= self._limit:
+            self._write_next()
+        result = [threading.Event(), None, None]
+        self._pending.append(result)
+        self._tasks.put((result, data))
+        self._chunks += 1
+
+    def write(self, s):
+        if not isinstance(s, bytes):
+            s = s.encode('utf-8')
+        self._buffer.append(s)
+        self._buffered += len(s)
+        if self._buffered >= self.chunksize:
+            data = b''.join(self._buffer)
+            self._buffer = []
+            self._buffered = 0
+            start = 0
+            while len(data) - start >= self.chunksize:
+                self._submit(data[start:start + self.chunksize])
+                start += self.chunksize
+            if start < len(data):
+                self.write(data[start:])
+
+    def flush(self):
+        pass
+
+    def close(self):
+        """Write all remaining data and stop the threads."""
+
+        try:
+            if self._buffered or not self._chunks:
+                # (An empty file is written as one empty member.)
+                self._submit(b''.join(self._buffer))
+                self._buffer = []
+                self._buffered = 0
+            while self._pending:
+                self._write_next()
+        finally:
+            for worker in self._workers:
+                self._tasks.put(None)
+            for worker in self._workers:
+                worker.join()
+            self._workers = []
+
+
+def write_gzip(f, content, level=6, chunksize=2**20, threads=None):
+    """Write 'content' to the binary file 'f' in gzip format.
+
+    'content' is a string (which is encoded as UTF-8) or bytes.  It is
+    compressed by a 'GzipWriter' (see there for the other arguments)
+    a chunk at a time, so no complete encoded copy is made.
+
+    """
+
+    g = GzipWriter(f, level, chunksize, threads)
+    try:
+        for start in range(0, len(content), chunksize):
+            g.write(content[start:start + chunksize])
+    finally:
+        g.close()
+
+
+def _arg_reduceat(ufunc, values, starts, counts):
+    """Return the index of the extreme value within each segment.
+
+    'values' is divided into consecutive segments beginning at the
+    indices 'starts' and having lengths 'counts'.  'ufunc' is
+    'numpy.fmin' or 'numpy.fmax'.  For each segment, return the index
+    of the first element that equals 'ufunc' reduced over the segment.
+    Segments containing only NaNs are skipped.
+
+    """
+
+    extreme = ufunc.reduceat(values, starts)
+    matches = numpy.flatnonzero(values == numpy.repeat(extreme, counts))
+    segments = numpy.searchsorted(starts, matches, 'right')
+    first = numpy.ones(len(matches), bool)
+    first[1:] = segments[1:] != segments[:-1]
+    return matches[first]
+
+
+def m4_indices(x, y, width):
+    """Return the indices of the points kept by M4 decimation.
+
+    'x' is a 1-d array of x values in increasing order.  'y' is a 1-d
+    array of the corresponding y values, or a 2-d array with one
+    column for each of several y values.  The x range is divided into
+    'width' equal intervals (normally one per pixel column of the
+    plot), and for each interval the first and last point and the
+    points with the minimum and maximum value of each y column are
+    kept.  A line drawn through the kept points is rendered exactly
+    like a line through all of the points.  The return value is a
+    sorted array of indices into 'x'.
+
+    """
+
+    x = numpy.asarray(x)
+    y = numpy.asarray(y)
+    if y.ndim == 1:
+        y = y[:,numpy.newaxis]
+    points = len(x)
+    if points <= 4 * width:
+        return numpy.arange(points)
+    if numpy.any(x[1:] < x[:-1]):
+        raise ValueError('x values must be in increasing order')
+
+    span = float(x[-1] - x[0])
+    if span > 0:
+        bins = ((x - x[0]) * (width / span)).astype(numpy.intp)
+        numpy.minimum(bins, width - 1, bins)
+    else:
+        bins = numpy.zeros(points, numpy.intp)
+
+    # x is sorted, so the points in each interval are contiguous:
+    starts = numpy.flatnonzero(bins[1:] != bins[:-1]) + 1
+    starts = numpy.concatenate(([0], starts))
+    counts = numpy.diff(numpy.append(starts, points))
+    kept = [starts, starts + counts - 1]
+    for column in range(y.shape[1]):
+        values = y[:,column]
+        kept.append(_arg_reduceat(numpy.fmin, values, starts, counts))
+        kept.append(_arg_reduceat(numpy.fmax, values, starts, counts))
+    return numpy.unique(numpy.concatenate(kept))
+
+
+def lttb_indices(x, y, threshold):
+    """Return the indices of the points kept by LTTB downsampling.
+
+    Largest-Triangle-Three-Buckets downsampling keeps the first and
+    last point, divides the remaining points into 'threshold - 2'
+    buckets of (nearly) equal size, and keeps from each bucket the
+    point that forms the largest triangle with the point kept from
+    the previous bucket and the average point of the next bucket.
+    This preserves the visual shape of a curve much better than
+    regular subsampling, and unlike M4 it returns exactly one point
+    per bucket, which suits point and smooth-line styles.
+
+    'x' and 'y' are 1-d arrays of the same length; 'x' is normally in
+    increasing order.  The return value is a sorted array of indices.
+
+    The algorithm is usually formulated as a loop over the buckets,
+    because each choice depends on the previous one.  Here all
+    buckets are first evaluated at once using the average point of
+    the previous bucket in place of its chosen point; then the
+    buckets whose predecessor's choice differs from the assumed one
+    are re-evaluated, again all at once, until nothing changes (or
+    until the changes stop dying out quickly, in which case the rest
+    are propagated one bucket at a time).  The result is identical to
+    that of the sequential algorithm, and typically costs two or three
+    passes over the data.
+
+    """
+
+    x = numpy.asarray(x)
+    y = numpy.asarray(y)
+    points = len(x)
+    if threshold < 3:
+        raise ValueError('threshold must be at least 3')
+    if points <= threshold:
+        return numpy.arange(points)
+
+    buckets = threshold - 2
+    edges = (numpy.arange(buckets + 1) * (points - 2)) // buckets + 1
+    starts = edges[:-1]
+    counts = numpy.diff(edges)
+
+    # The average point of each bucket, and the point that each
+    # bucket's triangles use on their right-hand side:
+    xmean = numpy.add.reduceat(x[:-1], starts) / counts
+    ymean = numpy.add.reduceat(y[:-1], starts) / counts
+    cx = numpy.concatenate((xmean[1:], [x[-1]]))
+    cy = numpy.concatenate((ymean[1:], [y[-1]]))
+
+    def select(active, ax, ay):
+        """Choose a point from each bucket in 'active'.
+
+        'active' is an increasing array of bucket numbers.  'ax' and
+        'ay' are the coordinates of the left-hand corner of the
+        triangles for each of those buckets.
+
+        """
+
+        n = counts[active]
+        first = starts[active[0]]
+        last = starts[active[-1]] + n[-1]
+        if last - first == n.sum():
+            # The buckets are contiguous, so avoid copying the points:
+            indices = slice(first, last)
+            offsets = starts[active] - first
+        else:
+            offsets = numpy.cumsum(n) - n
+            indices = (
+                numpy.arange(offsets[-1] + n[-1])
+                + numpy.repeat(starts[active] - offsets, n)
+                )
+        px = x[indices]
+        py = y[indices]
+        # Twice the area of the triangle with corners (ax,ay), (px,py),
+        # and (cx,cy) is |A*py + B*px + C|, where the coefficients are
+        # constant within a bucket:
+        a = ax - cx[active]
+        b = cy[active] - ay
+        c = -a * ay - b * ax
+        area = numpy.repeat(a, n) * py
+        area += numpy.repeat(b, n) * px
+        area += numpy.repeat(c, n)
+        numpy.absolute(area, area)
+        area[numpy.isnan(area)] = -1.0
+        best = _arg_reduceat(numpy.fmax, area, offsets, n)
+        if isinstance(indices, slice):
+            return best + first
+        else:
+            return indices[best]
+
+    everything = numpy.arange(buckets)
+    chosen = select(
+        everything,
+        numpy.concatenate(([x[0]], xmean[:-1])),
+        numpy.concatenate(([y[0]], ymean[:-1])),
+        )
+    # The first bucket is anchored on the first point, so its choice
+    # is already final, and each pass finalizes at least one more.
+    # Usually the number of buckets that need another look shrinks
+    # rapidly; if it doesn't (long monotonic stretches can propagate
+    # changes only one bucket per pass), finish bucket by bucket:
+    active = everything[1:]
+    while len(active):
+        previous = chosen[active - 1]
+        new = select(active, x[previous], y[previous])
+        changed = active[new != chosen[active]]
+        chosen[active] = new
+        changed = changed[changed < buckets - 1] + 1
+        if 2 * len(changed) > len(active):
+            active = changed
+            break
+        active = changed
+
+    if len(active):
+        bucket = active[0]
+        while bucket < buckets:
+            previous = chosen[bucket - 1]
+            (new,) = select(
+                numpy.array([bucket]),
+                x[previous:previous + 1], y[previous:previous + 1],
+                )
+            if new != chosen[bucket]:
+                chosen[bucket] = new
+                bucket += 1
+            else:
+                # Skip to the next bucket whose predecessor changed:
+                k = numpy.searchsorted(active, bucket, 'right')
+                if k == len(active):
+                    break
+                bucket = active[k]
+
+    return numpy.concatenate(([0], chosen, [points - 1]))
+
+
+def lttb(data, threshold):
+    """Reduce a 2-d data array to 'threshold' points using LTTB.
+
+    'data' is an array of shape '(points, columns)' whose first column
+    holds the x values and whose second column holds the y values
+    used to select the points (see 'lttb_indices').  Any further
+    columns are carried along.  Return the selected rows.
+
+    """
+
+    data = numpy.asarray(data)
+    return numpy.take(
+        data, lttb_indices(data[:,0], data[:,1], threshold), 0
+        )
+
+
+def histogram(data, bins=10, range=None, weights=None, chunksize=None):
+    """Compute a histogram of 'data', optionally a chunk at a time.
+
+    The arguments and the return value '(counts, edges)' are as for
+    'numpy.histogram', except that values that are not finite (NaN or
+    infinite) are ignored, like values outside of 'range'.  If
+    'chunksize' is specified, or if 'data' is a 'numpy.memmap' (in
+    which case 'chunksize' defaults to 2**22), 'data' and 'weights'
+    are processed 'chunksize' elements at a time so that a large
+    memory-mapped file never has to be held in memory all at once.
+    If 'bins' is an integer and 'range' is omitted, this requires an
+    additional pass over the data to determine the range of finite
+    values.
+
+    """
+
+    # (This has to be checked before asarray() drops the subclass.)
+    if chunksize is None and isinstance(data, numpy.memmap):
+        chunksize = 2**22
+    data = numpy.asarray(data)
+    if data.ndim == 0:
+        data = data.reshape(1)
+    if weights is not None:
+        weights = numpy.asarray(weights)
+        if weights.shape != data.shape:
+            weights = weights.reshape(data.shape)
+    # The chunks are taken along the first axis, so only one chunk at
+    # a time is ever copied (by ravel()).  Without a chunksize, all of
+    # the data are a single chunk, so that both cases treat the values
+    # in the same way:
+    if chunksize is None:
+        step = max(len(data), 1)
+    else:
+        step = max(1, chunksize // max(data[:1].size, 1))
+    starts = numpy.arange(0, len(data), step)
+    if numpy.ndim(bins) == 0 and range is None:
+        (lo, hi) = (numpy.inf, -numpy.inf)
+        for start in starts:
+            chunk = data[start:start + step].ravel()
+            chunk = chunk[numpy.isfinite(chunk)]
+            if len(chunk):
+                lo = min(lo, chunk.min())
+                hi = max(hi, chunk.max())
+        if lo > hi:
+            (lo, hi) = (0.0, 1.0)
+        range = (lo, hi)
+
+    # Using the same (bins, range) for each chunk gives the same edges
+    # as for all of the data at once:
+    (counts, edges) = numpy.histogram(data[:0].ravel(), bins, range)
+    if weights is not None:
+        counts = counts.astype(weights.dtype)
+    for start in starts:
+        chunk = data[start:start + step].ravel()
+        finite = numpy.isfinite(chunk)
+        if weights is None:
+            w = None
+        else:
+            w = weights[start:start + step].ravel()[finite]
+        counts += numpy.histogram(chunk[finite], bins, range, weights=w)[0]
+    return (counts, edges)
+
+
+def bin2d(x, y, bins, range=None, values=None, chunksize=None):
+    """Count the points (x, y) falling into each cell of a 2-d raster.
+
+    'x' and 'y' are arrays of the same size (they may be
+    'numpy.memmap's).  'bins' is a tuple '(numx, numy)' giving the
+    number of cells in each direction, and 'range' is a tuple
+    '((xmin, xmax), (ymin, ymax))'; by default the ranges of the
+    finite data values are used.  A range of zero width is widened by
+    0.5 on each side, as by 'numpy.histogram2d'.  Points outside of
+    the range (and points with NaN coordinates) are ignored.
+
+    If 'values' is specified, it should be an array of the same size
+    as 'x', and the sum of the values of the points in each cell is
+    computed as well.
+
+    The points are processed 'chunksize' at a time (by default 2**22),
+    so memory use doesn't depend on the number of points.  Return
+    '(counts, sums, xedges, yedges)', where 'counts' and 'sums' are
+    arrays with shape '(numx, numy)' ('sums' is None if 'values' was
+    not specified).
+
+    """
+
+    x = numpy.asarray(x).ravel()
+    y = numpy.asarray(y).ravel()
+    if values is not None:
+        values = numpy.asarray(values).ravel()
+    if chunksize is None:
+        chunksize = 2**22
+    (numx, numy) = bins
+    chunks = numpy.arange(0, len(x), chunksize)
+
+    if range is None:
+        range = []
+        for a in [x, y]:
+            (lo, hi) = (numpy.inf, -numpy.inf)
+            for start in chunks:
+                chunk = a[start:start + chunksize]
+                chunk = chunk[numpy.isfinite(chunk)]
+                if len(chunk):
+                    lo = min(lo, chunk.min())
+                    hi = max(hi, chunk.max())
+            if lo > hi:
+                (lo, hi) = (0.0, 1.0)
+            range.append((lo, hi))
+    limits = []
+    for (lo, hi) in range:
+        if lo > hi:
+            raise ValueError('the maximum of a range is less than its minimum')
+        elif lo == hi:
+            # Like numpy.histogram2d, widen a range of zero width:
+            (lo, hi) = (lo - 0.5, hi + 0.5)
+        limits.append((float(lo), float(hi)))
+    ((x0, x1), (y0, y1)) = limits
+
+    counts = numpy.zeros(numx * numy, numpy.int64)
+    if values is None:
+        sums = None
+    else:
+        sums = numpy.zeros(numx * numy, numpy.float64)
+    for start in chunks:
+        cx = x[start:start + chunksize]
+        cy = y[start:start + chunksize]
+        # (Comparisons with NaN are false, so this excludes NaNs too.)
+        inside = (cx >= x0) & (cx <= x1) & (cy >= y0) & (cy <= y1)
+        ix = ((cx[inside] - x0) * (numx / (x1 - x0))).astype(numpy.intp)
+        iy = ((cy[inside] - y0) * (numy / (y1 - y0))).astype(numpy.intp)
+        # Points on the upper edge belong to the last cell:
+        numpy.minimum(ix, numx - 1, ix)
+        numpy.minimum(iy, numy - 1, iy)
+        cell = ix * numy + iy
+        counts += numpy.bincount(cell, minlength=numx * numy)
+        if values is not None:
+            sums += numpy.bincount(
+                cell, weights=values[start:start + chunksize][inside],
+                minlength=numx * numy,
+                )
+
+    counts = counts.reshape((numx, numy))
+    if sums is not None:
+        sums = sums.reshape((numx, numy))
+    return (
+        counts, sums,
+        numpy.linspace(x0, x1, numx + 1), numpy.linspace(y0, y1, numy + 1),
+        )
+
+
+class MinMaxIndex:
+    """An index for extracting decimated views of a long series quickly.
+
+    The index records, for the points of a series divided into blocks
+    of 2**k consecutive points (for each k from 'base' up), the
+    positions of the minimum and maximum y value in each block.  With
+    it, the M4 decimation (see 'm4_indices') of any x window can be
+    approximated by looking at a number of blocks proportional to the
+    width of the plot rather than at every point in the window; see
+    'select'.  Thus a series with many millions of points can be
+    zoomed and panned interactively.
+
+    The index takes about 4/2**base integers per point.  It can be
+    saved to a directory of '.npy' files and loaded again (memory
+    mapped) so that it only has to be built once for a given series.
+
+    Members:
+
+        'x', 'y' -- the series (1-d arrays; 'x' in increasing order).
+            They may be 'numpy.memmap's.
+
+        'base' -- 2**'base' is the size of the smallest blocks.
+
+        'argmin', 'argmax' -- lists of arrays; 'argmin[j][i]' is the
+            index of the minimum y value in the 'i'th block of size
+            2**('base' + j).
+
+    """
+
+    def __init__(self, x, y, directory=None, base=3, chunksize=2**22):
+        """Build the index for the series 'x', 'y', or load it.
+
+        If 'directory' is specified and contains a saved index for a
+        series of the same length, it is loaded; otherwise the index
+        is built (which requires checking that 'x' is sorted) and, if
+        'directory' is specified, saved there.  The series is read
+        'chunksize' points at a time while building the index.
+
+        """
+
+        self.x = numpy.asarray(x).ravel()
+        self.y = numpy.asarray(y).ravel()
+        if self.x.shape != self.y.shape:
+            raise ValueError('x and y must have the same length')
+        self.base = base
+        self.argmin = []
+        self.argmax = []
+        if directory is not None and self.load(directory):
+            return
+
+        points = len(self.x)
+        for start in range(0, points, chunksize):
+            chunk = self.x[max(start - 1, 0):start + chunksize]
+            if numpy.any(chunk[1:] < chunk[:-1]):
+                raise ValueError('x values must be in increasing order')
+
+        size = 2**base
+        blocks = points // size
+        if blocks == 0:
+            return
+        if points >= 2**31:
+            dtype = numpy.int64
+        else:
+            dtype = numpy.int32
+        argmin = numpy.empty(blocks, dtype)
+        argmax = numpy.empty(blocks, dtype)
+        step = max(chunksize // size, 1)
+        for b0 in range(0, blocks, step):
+            b1 = min(b0 + step, blocks)
+            chunk = numpy.asarray(self.y[b0 * size:b1 * size])
+            chunk = chunk.reshape((b1 - b0, size))
+            offsets = numpy.arange(b0, b1) * size
+            argmin[b0:b1] = chunk.argmin(1) + offsets
+            argmax[b0:b1] = chunk.argmax(1) + offsets
+        self.argmin.append(argmin)
+        self.argmax.append(argmax)
+
+        while len(argmin) > 1:
+            pairs = len(argmin) // 2
+            (a, b) = (argmin[0:2 * pairs:2], argmin[1:2 * pairs:2])
+            argmin = numpy.where(self.y[b] < self.y[a], b, a)
+            (a, b) = (argmax[0:2 * pairs:2], argmax[1:2 * pairs:2])
+            argmax = numpy.where(self.y[b] > self.y[a], b, a)
+            self.argmin.append(argmin)
+            self.argmax.append(argmax)
+
+        if directory is not None:
+            self.save(directory)
+
+    def _filenames(self, directory, level):
+        return (
+            os.path.join(directory, 'argmin%d.npy' % (level,)),
+            os.path.join(directory, 'argmax%d.npy' % (level,)),
+            )
+
+    def save(self, directory):
+        """Save the index as '.npy' files in 'directory'."""
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for level in range(len(self.argmin)):
+            (minfile, maxfile) = self._filenames(directory, level)
+            numpy.save(minfile, self.argmin[level])
+            numpy.save(maxfile, self.argmax[level])
+
+    def load(self, directory):
+        """Load an index saved by 'save'.  Return true on success."""
+
+        (minfile, maxfile) = self._filenames(directory, 0)
+        if not os.path.exists(minfile):
+            return 0
+        argmin = numpy.load(minfile, mmap_mode='r')
+        if len(argmin) != len(self.x) // 2**self.base:
+            return 0
+        level = 0
+        while os.path.exists(minfile):
+            self.argmin.append(numpy.load(minfile, mmap_mode='r'))
+            self.argmax.append(numpy.load(maxfile, mmap_mode='r'))
+            level += 1
+            (minfile, maxfile) = self._filenames(directory, level)
+        return 1
+
+    def _blocks(self, start, stop, level):
+        """Cover 'start:stop' with aligned blocks no larger than 'level'.
+
+        Return a list of '(level, first, last)' tuples describing runs
+        of blocks, in order.  Level -1 denotes single points.
+
+        """
+
+        runs = []
+        while start < stop:
+            for k in range(level, -1, -1):
+                size = 2**(self.base + k)
+                end = (stop // size) * size
+                if start % size == 0 and start + size <= end:
+                    if k == level:
+                        runs.append((k, start // size, end // size))
+                        start = end
+                    else:
+                        runs.append((k, start // size, start // size + 1))
+                        start += size
+                    break
+            else:
+                runs.append((-1, start, start + 1))
+                start += 1
+        return runs
+
+    def select(self, xmin=None, xmax=None, width=800):
+        """Return the indices of the points to plot for an x window.
+
+        The window 'xmin <= x <= xmax' (either limit may be None,
+        meaning unlimited) is extended by one point on each side.  If
+        it contains fewer than 2**'base' points per pixel column of a
+        plot 'width' pixels wide, all of its points are returned.
+        Otherwise the window is covered by blocks at least 4 times
+        smaller than a pixel column (plus smaller blocks at the edges),
+        each block is assigned to the column containing its first
+        point, and the first and last point and the points with the
+        minimum and maximum y value of each column are returned.  The
+        work done is proportional to 'width' plus the logarithm of the
+        number of points.
+
+        """
+
+        points = len(self.x)
+        start = 0
+        stop = points
+        if xmin is not None:
+            start = max(numpy.searchsorted(self.x, xmin, 'left') - 1, 0)
+        if xmax is not None:
+            stop = min(numpy.searchsorted(self.x, xmax, 'right') + 1, points)
+        if stop - start <= 2**self.base * width or not self.argmin:
+            return numpy.arange(start, stop)
+
+        level = int(numpy.log2((stop - start) / (4.0 * width))) - self.base
+        level = max(0, min(level, len(self.argmin) - 1))
+        firsts = []
+        lasts = []
+        mins = []
+        maxs = []
+        for (k, first, last) in self._blocks(start, stop, level):
+            if k < 0:
+                indices = numpy.arange(first, last)
+                firsts.append(indices)
+                lasts.append(indices)
+                mins.append(indices)
+                maxs.append(indices)
+            else:
+                size = 2**(self.base + k)
+                firsts.append(numpy.arange(first, last) * size)
+                lasts.append(numpy.arange(first + 1, last + 1) * size - 1)
+                mins.append(numpy.asarray(self.argmin[k][first:last]))
+                maxs.append(numpy.asarray(self.argmax[k][first:last]))
+        firsts = numpy.concatenate(firsts)
+        lasts = numpy.concatenate(lasts)
+        mins = numpy.concatenate(mins)
+        maxs = numpy.concatenate(maxs)
+
+        # Assign the blocks (which are in order) to pixel columns:
+        x = self.x[firsts]
+        span = float(self.x[stop - 1] - self.x[start])
+        if span > 0:
+            columns = ((x - self.x[start]) * (width / span)).astype(numpy.intp)
+            numpy.minimum(columns, width - 1, columns)
+        else:
+            columns = numpy.zeros(len(firsts), numpy.intp)
+        starts = numpy.flatnonzero(columns[1:] != columns[:-1]) + 1
+        starts = numpy.concatenate(([0], starts))
+        counts = numpy.diff(numpy.append(starts, len(firsts)))
+        kept = [
+            firsts[starts],
+            lasts[starts + counts - 1],
+            mins[_arg_reduceat(numpy.fmin, self.y[mins], starts, counts)],
+            maxs[_arg_reduceat(numpy.fmax, self.y[maxs], starts, counts)],
+            ]
+        return numpy.unique(numpy.concatenate(kept))